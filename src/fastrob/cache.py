@@ -0,0 +1,89 @@
+from __future__ import annotations
+from typing import Optional
+
+import os
+import json
+import zipfile
+
+import numpy as np
+
+from toolpath import Toolpath
+
+
+MAX_SIZE: int = 1 << 30
+FORMAT: int = 2
+
+
+class SliceCache:
+    def __init__(self, directory: str, max_size: int = MAX_SIZE) -> None:
+        os.makedirs(directory, exist_ok=True)
+
+        self._directory: str = directory
+        self._max_size: int = max_size
+        self._stats_file: str = os.path.join(directory, "stats.json")
+
+    @property
+    def stats(self) -> dict[str, int]:
+        try:
+            with open(self._stats_file, "r") as f:
+                stats: dict[str, int] = json.load(f)
+            if isinstance(stats, dict):
+                return stats
+        except (OSError, ValueError):
+            pass
+
+        if os.path.exists(self._stats_file):
+            os.remove(self._stats_file)
+        return {"hits": 0, "misses": 0, "evictions": 0}
+
+    def entry(self, key: str) -> str:
+        return os.path.join(self._directory, key + "." + str(FORMAT) + ".npz")
+
+    def entries(self) -> list[str]:
+        return [os.path.join(self._directory, name) for name in os.listdir(self._directory) if name.endswith(".npz")]
+
+    def record(self, field: str, count: int = 1) -> None:
+        stats: dict[str, int] = self.stats
+        stats[field] = stats.get(field, 0) + count
+
+        with open(self._stats_file + ".tmp", "w") as f:
+            json.dump(stats, f)
+        os.replace(self._stats_file + ".tmp", self._stats_file)
+
+    def get(self, key: str) -> Optional[Toolpath]:
+        file: str = self.entry(key)
+
+        try:
+            with np.load(file) as data:
+                paths: Toolpath = Toolpath.from_arrays({name: data[name] for name in data.files})
+            os.utime(file)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            if os.path.exists(file):
+                os.remove(file)
+            self.record("misses")
+            return None
+
+        self.record("hits")
+        return paths
+
+    def put(self, key: str, paths: Toolpath) -> None:
+        file: str = self.entry(key)
+        with open(file + ".tmp", "wb") as f:
+            np.savez(f, **paths.to_arrays())
+        os.replace(file + ".tmp", file)
+
+        self.evict()
+
+    def evict(self) -> None:
+        entries: list[str] = sorted(self.entries(), key=os.path.getmtime)
+        size: int = sum(os.path.getsize(entry) for entry in entries)
+
+        evicted: int = 0
+        while entries and size > self._max_size:
+            entry: str = entries.pop(0)
+            size -= os.path.getsize(entry)
+            os.remove(entry)
+            evicted += 1
+
+        if evicted > 0:
+            self.record("evictions", evicted)
@@ -1,15 +1,15 @@
 from __future__ import annotations
 from typing import cast, Optional
 
+import os
 import importlib
 
-import awkward as ak
-
 import FreeCADGui as Gui
 import FreeCAD as App
 import Part
 
-from utils import linear_move, point_move
+from toolpath import Toolpath, tessellate
+from emitter import compact_moves, emit_chunks, point_velocities, write_shards, write_arrays, WRITE_BUFFER, TEMPLATE
 
 
 class Compiler:
@@ -20,6 +20,10 @@ class Compiler:
         feature_obj.addProperty("App::PropertyStringList", "dCustomStart", "Compiler", "Start commands (path wise)")
         feature_obj.addProperty("App::PropertyStringList", "eCustomEnd", "Compiler", "End commands (path wise)")
         feature_obj.addProperty("App::PropertyBool", "fSilent", "Compiler", "True prevents compiling on recompute")
+        feature_obj.addProperty("App::PropertyInteger", "gShards", "Compiler", "Number of sub-programs (0 for none)")
+        feature_obj.addProperty("App::PropertyEnumeration", "hOutput", "Compiler", "Moves inline, as arrays or splines")
+        feature_obj.addProperty("App::PropertyLength", "iTolerance", "Compiler", "Chordal tolerance (0 keeps all)")
+        feature_obj.addProperty("App::PropertySpeed", "jVelocity", "Compiler", "Path velocity (0 follows feed)")
 
         feature_obj.aSlicer = slicer
         feature_obj.bFile = ""
@@ -27,6 +31,10 @@ class Compiler:
         feature_obj.dCustomStart = []
         feature_obj.eCustomEnd = []
         feature_obj.fSilent = False
+        feature_obj.gShards = 0
+        feature_obj.hOutput = ["Moves", "Arrays", "Spline"]
+        feature_obj.iTolerance = 0.
+        feature_obj.jVelocity = 0.
 
         feature_obj.Proxy = self
         self._feature_obj: Part.Feature = feature_obj
@@ -36,56 +44,49 @@ class Compiler:
         if not feature_obj.getPropertyByName("fSilent"):
 
             try:
-                with open(feature_obj.getPropertyByName("bFile"), "w") as file:
-                    has_axis_offset: bool = False
-                    if feature_obj.getPropertyByName("aSlicer").iAxisOffset != App.Vector(0, 0, 0):
-                        has_axis_offset = True
-
-                    paths: Optional[ak.Array] = feature_obj.getPropertyByName("aSlicer").Proxy.paths
-                    if paths is not None:
-                        for layer in paths.to_list():
-                            for path in layer:
-                                for idx, pos in enumerate(path):
-
-                                    if has_axis_offset:
-                                        if idx < 2:
-                                            cmd: str = point_move(feature_obj.getPropertyByName("cMachine"), pos)
-                                            file.write(cmd + "\n")
-
-                                            if idx == 1:
-                                                for cmd in feature_obj.getPropertyByName("dCustomStart"):
-                                                    file.write(cmd + "\n")
-
-                                        elif idx < len(path) - 1:
-                                            cmd: str = linear_move(feature_obj.getPropertyByName("cMachine"), pos)
-                                            file.write(cmd + "\n")
-
-                                        else:
-                                            for cmd in feature_obj.getPropertyByName("eCustomEnd"):
-                                                file.write(cmd + "\n")
-
-                                            cmd: str = point_move(feature_obj.getPropertyByName("cMachine"), pos)
-                                            file.write(cmd + "\n")
-
-                                    else:
-                                        if idx == 0:
-                                            cmd: str = point_move(feature_obj.getPropertyByName("cMachine"), pos)
-                                            file.write(cmd + "\n")
-
-                                            for cmd in feature_obj.getPropertyByName("dCustomStart"):
-                                                file.write(cmd + "\n")
-
-                                        elif idx < len(path):
-                                            cmd: str = linear_move(feature_obj.getPropertyByName("cMachine"), pos)
-                                            file.write(cmd + "\n")
-
-                                            if idx == len(path) - 1:
-                                                for cmd in feature_obj.getPropertyByName("eCustomEnd"):
-                                                    file.write(cmd + "\n")
-
-                                file.write("\n")
-
-                        print("Result written to", feature_obj.getPropertyByName("bFile"))
+                slicer: Part.Feature = feature_obj.getPropertyByName("aSlicer")
+                has_axis_offset: bool = slicer.iAxisOffset != App.Vector(0, 0, 0)
+                shards: int = feature_obj.getPropertyByName("gShards") if hasattr(feature_obj, "gShards") else 0
+                output: str = feature_obj.getPropertyByName("hOutput") if hasattr(feature_obj, "hOutput") else "Moves"
+                if feature_obj.getPropertyByName("cMachine") != "KUKA":
+                    output: str = "Moves"
+                velocity: float = float(feature_obj.jVelocity) / 1000. if hasattr(feature_obj, "jVelocity") else 0.
+
+                paths: Optional[Toolpath] = slicer.Proxy.selected(slicer)
+                if paths is not None and output != "Moves":
+                    paths: Toolpath = tessellate(paths)
+                tolerance: float = float(feature_obj.iTolerance) if hasattr(feature_obj, "iTolerance") else 0.
+                if paths is not None and paths.point_count > 0 and tolerance > 0:
+                    count: int = paths.point_count
+                    paths: Toolpath = compact_moves(paths, tolerance, has_axis_offset)
+                    print("Simplification removed", count - paths.point_count, "of", count, "motion commands")
+
+                if paths is not None and shards > 0:
+                    files: list[str] = write_shards(
+                        feature_obj.getPropertyByName("bFile"), paths, shards,
+                        feature_obj.getPropertyByName("cMachine"), feature_obj.getPropertyByName("dCustomStart"),
+                        feature_obj.getPropertyByName("eCustomEnd"), has_axis_offset, output, velocity
+                    )
+                    print("Result written to", feature_obj.getPropertyByName("bFile"), "with", len(files), "shards")
+
+                elif paths is not None and output == "Arrays":
+                    file: str = feature_obj.getPropertyByName("bFile")
+                    write_arrays(file, os.path.splitext(os.path.basename(file))[0], paths.points, paths.path_offsets,
+                                 feature_obj.getPropertyByName("dCustomStart"),
+                                 feature_obj.getPropertyByName("eCustomEnd"), has_axis_offset, TEMPLATE, velocity,
+                                 point_velocities(paths))
+                    print("Result written to", file)
+
+                else:
+                    with open(feature_obj.getPropertyByName("bFile"), "w", buffering=WRITE_BUFFER) as file:
+                        if paths is not None:
+                            for chunk in emit_chunks(paths, feature_obj.getPropertyByName("cMachine"),
+                                                     feature_obj.getPropertyByName("dCustomStart"),
+                                                     feature_obj.getPropertyByName("eCustomEnd"), has_axis_offset,
+                                                     output == "Spline", velocity):
+                                file.write(chunk)
+
+                            print("Result written to", feature_obj.getPropertyByName("bFile"))
             except FileNotFoundError as e:
                 print(e)
 
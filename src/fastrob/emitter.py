@@ -0,0 +1,329 @@
+from __future__ import annotations
+from typing import Iterator, Optional, TextIO
+
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from toolpath import Toolpath, simplify, tessellate
+from gcode import python_executable
+
+
+CHUNK_POINTS: int = 1 << 16
+WRITE_BUFFER: int = 1 << 20
+
+MOVES: dict[str, tuple[str, str, str, str, str, str, str]] = {
+    "KUKA": ("PTP {E6POS: ", "}", "LIN {E6POS: ", "} C_DIS", "X %.1f, Y %.1f, Z %.1f, A 0, B 90, C 0",
+             "CIRC {E6POS: X %.1f, Y %.1f, Z %.1f}, {E6POS: ", "$VEL.CP = %.3f\n")
+}
+
+SPLINES: dict[str, tuple[str, str, str, str, str]] = {
+    "KUKA": ("SPLINE", " WITH $VEL.CP = %.3f", "ENDSPLINE", "  SPL {E6POS: ", "}")
+}
+
+PROGRAMS: dict[str, tuple[str, str, str]] = {
+    "KUKA": ("DEF %s()\n", "END\n", "%s()\n")
+}
+
+TEMPLATE: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "robots", "kuka_template.src")
+SEPARATOR: str = ";------------------------------------------------------\n"
+CHANNELS: tuple[str, ...] = ("feed", "type", "width")
+
+
+def command_points(paths: Toolpath, axis_offset: bool) -> np.ndarray:
+    fixed: np.ndarray = np.zeros(paths.point_count, dtype=bool)
+    fixed[paths.path_starts] = True
+    fixed[paths.path_stops - 1] = True
+    if axis_offset:
+        fixed[np.minimum(paths.path_starts + 1, paths.path_stops - 1)] = True
+        fixed[np.maximum(paths.path_stops - 2, paths.path_starts)] = True
+
+    if "arc_via" in paths.attributes:
+        arcs: np.ndarray = np.flatnonzero(~np.isnan(paths.attributes["arc_via"][:, 0]))
+        fixed[arcs] = True
+        fixed[np.maximum(arcs - 1, 0)] = True
+
+    for name in CHANNELS:
+        if name in paths.attributes:
+            column: np.ndarray = paths.attributes[name]
+            changes: np.ndarray = np.flatnonzero(
+                (column[1:] != column[:-1]) & ~(np.isnan(column[1:]) & np.isnan(column[:-1]))
+            ) + 1
+            fixed[changes] = True
+            fixed[changes - 1] = True
+    return fixed
+
+
+def ptp_points(path_offsets: np.ndarray, axis_offset: bool) -> np.ndarray:
+    starts: np.ndarray = path_offsets[:-1]
+    lengths: np.ndarray = np.diff(path_offsets)
+
+    is_ptp: np.ndarray = np.zeros(int(path_offsets[-1]), dtype=bool)
+    is_ptp[starts] = True
+    if axis_offset:
+        is_ptp[starts[lengths > 1] + 1] = True
+        is_ptp[path_offsets[1:] - 1] = True
+    return is_ptp
+
+
+def velocity_changes(paths: Toolpath, axis_offset: bool) -> Optional[np.ndarray]:
+    if "feed" not in paths.attributes:
+        return None
+
+    velocities: np.ndarray = np.round(paths.attributes["feed"] / 60000., 3)
+    ids: np.ndarray = np.flatnonzero(~ptp_points(paths.path_offsets, axis_offset) & ~np.isnan(velocities))
+    is_change: np.ndarray = np.ones(len(ids), dtype=bool)
+    is_change[1:] = velocities[ids[1:]] != velocities[ids[:-1]]
+
+    changes: np.ndarray = np.full(paths.point_count, np.nan)
+    changes[ids[is_change]] = velocities[ids[is_change]]
+    return changes
+
+
+def point_velocities(paths: Toolpath) -> Optional[np.ndarray]:
+    if "feed" not in paths.attributes or np.all(np.isnan(paths.attributes["feed"])):
+        return None
+
+    velocities: np.ndarray = np.round(paths.attributes["feed"] / 60000., 3)
+    is_valid: np.ndarray = ~np.isnan(velocities)
+    ids: np.ndarray = np.maximum.accumulate(np.where(is_valid, np.arange(paths.point_count), np.argmax(is_valid)))
+    return velocities[ids]
+
+
+def compact_moves(paths: Toolpath, tolerance: float, axis_offset: bool) -> Toolpath:
+    fixed: np.ndarray = command_points(paths, axis_offset)
+
+    repeated: np.ndarray = np.zeros(paths.point_count, dtype=bool)
+    repeated[1:] = np.all(paths.points[1:] == paths.points[:-1], axis=1)
+    repeated[paths.path_starts] = False
+
+    drop: np.ndarray = repeated & ~fixed
+    previous: np.ndarray = np.flatnonzero(repeated & fixed) - 1
+    drop[previous[~fixed[previous]]] = True
+
+    ids: np.ndarray = np.flatnonzero(~drop)
+    counts: np.ndarray = np.add.reduceat(~drop, paths.path_starts) if paths.path_count > 0 else np.zeros(0)
+    deduplicated: Toolpath = paths.gather(ids, np.concatenate([[0], np.cumsum(counts)]))
+
+    return simplify(deduplicated, tolerance, command_points(deduplicated, axis_offset))
+
+
+def emit(points: np.ndarray, path_offsets: np.ndarray, machine: str, custom_start: list[str],
+         custom_end: list[str], axis_offset: bool, vias: Optional[np.ndarray] = None, spline: bool = False,
+         velocity: float = 0., velocities: Optional[np.ndarray] = None) -> str:
+    if len(points) == 0:
+        return ""
+
+    ptp_head, ptp_tail, lin_head, lin_tail, coordinates, circ_head, velocity_head = MOVES.get(
+        machine, ("", "", "", "", "", "", "")
+    )
+    spline_open, spline_velocity, spline_close, spl_head, spl_tail = SPLINES.get(machine, ("", "", "", "", ""))
+    velocity_tail: str = ""
+    if spline and spl_head:
+        lin_head, lin_tail, circ_head = spl_head, spl_tail, ""
+        velocity_head, velocity_tail = "", spline_velocity
+
+    starts: np.ndarray = path_offsets[:-1]
+    lasts: np.ndarray = path_offsets[1:] - 1
+    lengths: np.ndarray = np.diff(path_offsets)
+
+    is_ptp: np.ndarray = ptp_points(path_offsets, axis_offset)
+    heads: np.ndarray = np.where(is_ptp, ptp_head, lin_head).astype(object)
+    tails: np.ndarray = np.where(is_ptp, ptp_tail, lin_tail).astype(object)
+
+    if vias is not None and circ_head:
+        is_circ: np.ndarray = ~is_ptp & ~np.isnan(vias[:, 0])
+        circ_vias: np.ndarray = vias[is_circ]
+        heads[is_circ] = ((circ_head + "\0") * len(circ_vias) % tuple(circ_vias.ravel().tolist())).split("\0")[:-1]
+
+    if velocities is not None and (velocity_head or velocity_tail):
+        is_change: np.ndarray = ~np.isnan(velocities)
+        changes: np.ndarray = velocities[is_change]
+        text: str = velocity_head or velocity_tail
+        texts: np.ndarray = np.array(((text + "\0") * len(changes) % tuple(changes.tolist())).split("\0")[:-1],
+                                     dtype=object)
+        if velocity_head:
+            heads[is_change] = texts + heads[is_change]
+        else:
+            tails[is_change] = tails[is_change] + texts
+
+    if spline and spl_head:
+        firsts: np.ndarray = starts + (2 if axis_offset else 1)
+        finals: np.ndarray = lasts - (1 if axis_offset else 0)
+        has_block: np.ndarray = firsts <= finals
+        opening: str = spline_open + (spline_velocity % velocity if velocity > 0 else "") + "\n"
+        heads[firsts[has_block]] = opening + heads[firsts[has_block]]
+        tails[finals[has_block]] += "\n" + spline_close
+
+    start_block: str = "".join("\n" + cmd for cmd in custom_start)
+    end_block: str = "".join("\n" + cmd for cmd in custom_end)
+    if axis_offset:
+        tails[starts[lengths > 1] + 1] += start_block
+        end_ids: np.ndarray = lasts[lengths > 2]
+        heads[end_ids] = end_block[1:] + "\n" + heads[end_ids] if custom_end else heads[end_ids]
+    else:
+        tails[starts] += start_block
+        tails[lasts[lengths > 1]] += end_block
+    tails[lasts] += "\n"
+
+    columns: int = coordinates.count("%")
+    values: np.ndarray = np.empty((len(points), columns + 2), dtype=object)
+    values[:, 0] = heads
+    values[:, 1:columns + 1] = points[:, :columns]
+    values[:, -1] = tails
+
+    return ("%s" + coordinates + "%s\n") * len(points) % tuple(values.ravel().tolist())
+
+
+def emit_chunks(paths: Toolpath, machine: str, custom_start: list[str], custom_end: list[str], axis_offset: bool,
+                spline: bool = False, velocity: float = 0., chunk_points: int = CHUNK_POINTS) -> Iterator[str]:
+    bounds: np.ndarray = np.unique(np.concatenate([
+        [0], np.searchsorted(paths.path_offsets, np.arange(chunk_points, paths.point_count, chunk_points)),
+        [paths.path_count]
+    ]))
+
+    vias: Optional[np.ndarray] = paths.attributes.get("arc_via")
+    changes: Optional[np.ndarray] = velocity_changes(paths, axis_offset) if velocity == 0 else None
+    velocity_head: str = MOVES.get(machine, ("", "", "", "", "", "", ""))[6]
+    if velocity > 0 and velocity_head and paths.point_count > 0 and not (spline and SPLINES.get(machine)):
+        yield velocity_head % velocity
+
+    for first, last in zip(bounds[:-1], bounds[1:]):
+        path_offsets: np.ndarray = paths.path_offsets[first:last + 1]
+        yield emit(paths.points[path_offsets[0]:path_offsets[-1]], path_offsets - path_offsets[0], machine,
+                   custom_start, custom_end, axis_offset,
+                   vias[path_offsets[0]:path_offsets[-1]] if vias is not None else None, spline, velocity,
+                   changes[path_offsets[0]:path_offsets[-1]] if changes is not None else None)
+
+
+def write_array(file: TextIO, name: str, values: np.ndarray, element: str) -> None:
+    for first in range(0, len(values), CHUNK_POINTS):
+        chunk: np.ndarray = values[first:first + CHUNK_POINTS]
+        rows: np.ndarray = np.column_stack([np.arange(first + 1, first + len(chunk) + 1), chunk])
+        file.write((name + "[%d]=" + element + "\n") * len(chunk) % tuple(rows.ravel().tolist()))
+
+
+def write_data(file: str, name: str, points: np.ndarray, path_offsets: np.ndarray,
+               velocities: Optional[np.ndarray] = None) -> None:
+    with open(file, "w", buffering=WRITE_BUFFER) as f:
+        f.write("DEFDAT " + name + "\n")
+        f.write("DECL INT PATH_COUNT=" + str(len(path_offsets) - 1) + "\n")
+        f.write("DECL INT PATH_FIRST[" + str(len(path_offsets) - 1) + "]\n")
+        write_array(f, "PATH_FIRST", path_offsets[:-1] + 1, "%d")
+        f.write("DECL INT PATH_LAST[" + str(len(path_offsets) - 1) + "]\n")
+        write_array(f, "PATH_LAST", path_offsets[1:], "%d")
+        f.write("DECL E6POS POINTS[" + str(len(points)) + "]\n")
+        write_array(f, "POINTS", points, "{X %.1f, Y %.1f, Z %.1f, A 0, B 90, C 0}")
+        if velocities is not None:
+            f.write("DECL REAL VELOCITIES[" + str(len(velocities)) + "]\n")
+            write_array(f, "VELOCITIES", velocities, "%.3f")
+        f.write("ENDDAT\n")
+
+
+def loop_program(custom_start: list[str], custom_end: list[str], axis_offset: bool, velocity: float = 0.,
+                 velocities: bool = False) -> str:
+    lines: list[str] = ["$VEL.CP = %.3f" % velocity] if velocity > 0 else []
+    lines.extend(["FOR PATH_IDX = 1 TO PATH_COUNT", "  PTP POINTS[PATH_FIRST[PATH_IDX]]"])
+    if axis_offset:
+        lines.append("  PTP POINTS[PATH_FIRST[PATH_IDX] + 1]")
+    lines.extend("  " + cmd for cmd in custom_start)
+    lines.extend([
+        "  FOR POINT_IDX = PATH_FIRST[PATH_IDX] + " + ("2" if axis_offset else "1") + " TO PATH_LAST[PATH_IDX]" +
+        (" - 1" if axis_offset else "")
+    ])
+    if velocities and velocity <= 0:
+        lines.append("    $VEL.CP = VELOCITIES[POINT_IDX]")
+    lines.extend(["    LIN POINTS[POINT_IDX] C_DIS", "  ENDFOR"])
+    lines.extend("  " + cmd for cmd in custom_end)
+    if axis_offset:
+        lines.append("  PTP POINTS[PATH_LAST[PATH_IDX]]")
+    lines.append("ENDFOR")
+    return "\n".join(lines) + "\n"
+
+
+def template_program(name: str, body: str, declaration: str = "", template: Optional[str] = None) -> str:
+    if template is None:
+        return "DEF " + name + "()\n" + declaration + body + "END\n"
+
+    with open(template, "r") as f:
+        program: str = f.read()
+    program: str = program.replace("DEF template()\n", "DEF " + name + "()\n" + declaration, 1)
+    head, separator, tail = program.rpartition(SEPARATOR)
+    return head + body + "\n" + separator + tail
+
+
+def write_arrays(file: str, name: str, points: np.ndarray, path_offsets: np.ndarray, custom_start: list[str],
+                 custom_end: list[str], axis_offset: bool, template: Optional[str] = None, velocity: float = 0.,
+                 velocities: Optional[np.ndarray] = None) -> str:
+    if velocity > 0:
+        velocities: Optional[np.ndarray] = None
+    write_data(os.path.splitext(file)[0] + ".dat", name, points, path_offsets, velocities)
+
+    loop: str = loop_program(custom_start, custom_end, axis_offset, velocity, velocities is not None)
+    with open(file, "w") as f:
+        f.write(template_program(name, loop, "DECL INT PATH_IDX, POINT_IDX\n", template))
+
+    return file
+
+
+def shard_bounds(paths: Toolpath, shards: int) -> np.ndarray:
+    targets: np.ndarray = paths.point_count * np.arange(1, shards) / shards
+    return np.unique(np.concatenate([
+        [0], np.searchsorted(paths.layer_point_offsets, targets), [paths.layer_count]
+    ]))
+
+
+def write_program(file: str, name: str, paths: Toolpath, machine: str, custom_start: list[str],
+                  custom_end: list[str], axis_offset: bool, output: str = "Moves", velocity: float = 0.) -> str:
+    if output != "Moves":
+        paths: Toolpath = tessellate(paths)
+    if output == "Arrays" and machine == "KUKA":
+        return write_arrays(file, name, paths.points, paths.path_offsets, custom_start, custom_end, axis_offset,
+                            velocity=velocity, velocities=point_velocities(paths))
+
+    header, footer, _ = PROGRAMS.get(machine, ("", "", ""))
+
+    with open(file, "w", buffering=WRITE_BUFFER) as f:
+        if header:
+            f.write(header % name)
+        for chunk in emit_chunks(paths, machine, custom_start, custom_end, axis_offset, output == "Spline", velocity):
+            f.write(chunk)
+        f.write(footer)
+
+    return file
+
+
+def write_shards(file: str, paths: Toolpath, shards: int, machine: str, custom_start: list[str],
+                 custom_end: list[str], axis_offset: bool, output: str = "Moves", velocity: float = 0.,
+                 processes: Optional[int] = None, template: Optional[str] = TEMPLATE) -> list[str]:
+    stem, extension = os.path.splitext(file)
+    name: str = os.path.basename(stem)
+    bounds: np.ndarray = shard_bounds(paths, shards)
+
+    jobs: list[tuple] = []
+    for idx, (first, last) in enumerate(zip(bounds[:-1], bounds[1:])):
+        shard: Toolpath = paths.layers(int(first), int(last))
+        jobs.append((stem + "_" + str(idx) + extension, name + "_" + str(idx), shard, machine, custom_start,
+                     custom_end, axis_offset, output, velocity))
+
+    executable: Optional[str] = python_executable()
+    workers: int = min(processes or os.cpu_count() or 1, len(jobs))
+    if workers < 2 or executable is None:
+        files: list[str] = [write_program(*job) for job in jobs]
+    else:
+        context: multiprocessing.context.SpawnContext = multiprocessing.get_context("spawn")
+        context.set_executable(executable)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            files: list[str] = list(pool.map(write_program, *zip(*jobs)))
+
+    header, footer, call = PROGRAMS.get(machine, ("", "", ""))
+    calls: str = "".join(call % job[1] for job in jobs) if call else ""
+    with open(file, "w") as f:
+        if call:
+            f.write(template_program(name, calls, template=template))
+        else:
+            f.write((header % name if header else "") + footer)
+
+    return files
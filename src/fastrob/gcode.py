@@ -0,0 +1,440 @@
+from __future__ import annotations
+from typing import BinaryIO, Optional
+
+import os
+import sys
+import mmap
+import hashlib
+import multiprocessing
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+LETTER, NUMBER, X, Y, Z, E, I, J, F, TYPE, WIDTH = (
+    "letter", "number", "x", "y", "z", "e", "i", "j", "f", "type", "width"
+)
+TABLE: np.dtype = np.dtype([
+    (LETTER, np.uint8), (NUMBER, np.float32), (TYPE, np.int8), (WIDTH, np.float32),
+    (X, np.float64), (Y, np.float64), (Z, np.float64), (E, np.float64), (I, np.float64), (J, np.float64),
+    (F, np.float64)
+])
+
+BLOCK_SIZE: int = 1 << 20
+PARALLEL_SIZE: int = 1 << 25
+LAYER_MARKER: bytes = b";LAYER_CHANGE"
+TYPE_MARKER: bytes = b";TYPE:"
+WIDTH_MARKER: bytes = b";WIDTH:"
+
+FEATURE_TYPES: tuple[str, ...] = (
+    "Perimeter", "External perimeter", "Overhang perimeter", "Internal infill", "Solid infill", "Top solid infill",
+    "Ironing", "Bridge infill", "Gap fill", "Skirt/Brim", "Support material", "Support material interface",
+    "Wipe tower", "Custom"
+)
+
+_NEWLINE: int = ord("\n")
+_BLANKS: np.ndarray = np.isin(np.arange(256), [ord(" "), ord("\t"), ord("\n")])
+_SEPARATORS: np.ndarray = np.isin(np.arange(256), [ord(" "), ord("\t"), ord("\n"), ord("\r"), ord(";")])
+_PARAMS: dict[int, str] = {ord("X"): X, ord("Y"): Y, ord("Z"): Z, ord("E"): E, ord("I"): I, ord("J"): J, ord("F"): F}
+_COMMANDS: np.ndarray = np.array([ord("G"), ord("M"), ord("T")], dtype=np.uint8)
+_FEATURE_CODES: dict[bytes, int] = {name.encode(): code for code, name in enumerate(FEATURE_TYPES)}
+_NO_TYPE: int = -2
+_EMPTY_ROW: np.ndarray = np.array((0, np.nan, _NO_TYPE, np.nan) + (np.nan,) * 7, dtype=TABLE)
+
+
+def parse_numbers(data: np.ndarray, starts: np.ndarray, stops: np.ndarray) -> np.ndarray:
+    lengths: np.ndarray = stops - starts
+    total: int = int(lengths.sum())
+    if total == 0:
+        return np.full(len(starts), np.nan)
+
+    word_ids: np.ndarray = np.repeat(np.arange(len(starts)), lengths)
+    word_firsts: np.ndarray = np.cumsum(lengths) - lengths
+    chars: np.ndarray = data[np.arange(total) - np.repeat(word_firsts - starts, lengths)]
+
+    def ranks(mask: np.ndarray) -> np.ndarray:
+        counts: np.ndarray = np.cumsum(mask)
+        return counts - np.repeat(counts[word_firsts] - mask[word_firsts], lengths)
+
+    def count(mask: np.ndarray) -> np.ndarray:
+        return np.bincount(word_ids, weights=mask, minlength=len(starts))
+
+    def integer(mask: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        mask_count: np.ndarray = count(mask)
+        places: np.ndarray = np.where(mask, mask_count[word_ids] - ranks(mask), 0)
+        return count(np.where(mask, chars.astype(np.float64) - ord("0"), 0.) * 10. ** places), mask_count
+
+    is_digit: np.ndarray = (chars >= ord("0")) & (chars <= ord("9"))
+    is_minus: np.ndarray = chars == ord("-")
+    is_exponent: np.ndarray = (chars | 0x20) == ord("e")
+    exponent: Optional[np.ndarray] = None
+    if np.any(is_exponent):
+        after_exponent: np.ndarray = ranks(is_exponent) > 0
+        exponent, _ = integer(is_digit & after_exponent)
+        exponent: np.ndarray = np.where(count(is_minus & after_exponent) > 0, -exponent, exponent)
+        is_digit: np.ndarray = is_digit & ~after_exponent
+        is_minus: np.ndarray = is_minus & ~after_exponent
+
+    mantissa, digit_count = integer(is_digit)
+    decimals: np.ndarray = count(is_digit & (ranks(chars == ord(".")) > 0))
+    values: np.ndarray = np.where(count(is_minus) > 0, -mantissa, mantissa)
+    if exponent is None:
+        values: np.ndarray = values / 10. ** decimals
+    else:
+        scales: np.ndarray = exponent - decimals
+        values: np.ndarray = np.where(scales < 0, values / 10. ** -scales, values * 10. ** scales)
+    values[digit_count == 0] = np.nan
+    return values
+
+
+def find_markers(data: np.ndarray, semicolons: np.ndarray, marker: bytes) -> np.ndarray:
+    candidates: np.ndarray = semicolons[(data[semicolons - 1] == _NEWLINE) & (semicolons + len(marker) < len(data))]
+    for offset, char in enumerate(marker[1:], 1):
+        candidates: np.ndarray = candidates[data[candidates + offset] == char]
+    return candidates
+
+
+def tokenize(buffer: bytes | memoryview | np.ndarray) -> np.ndarray:
+    data: np.ndarray = np.frombuffer(buffer, dtype=np.uint8)
+    if len(data) == 0:
+        return np.empty(0, dtype=TABLE)
+    if data[-1] != _NEWLINE:
+        data: np.ndarray = np.append(data, np.uint8(_NEWLINE))
+
+    line_ends: np.ndarray = np.flatnonzero(data == _NEWLINE)
+    separators: np.ndarray = np.flatnonzero(_SEPARATORS[data])
+
+    is_upper: np.ndarray = (data >= ord("A")) & (data <= ord("Z"))
+    is_upper[1:] &= _BLANKS[data[:-1]]
+    word_starts: np.ndarray = np.flatnonzero(is_upper)
+    word_lines: np.ndarray = np.searchsorted(line_ends, word_starts)
+
+    semicolons: np.ndarray = np.flatnonzero(data == ord(";"))
+    comment_starts: np.ndarray = np.full(len(line_ends), len(data))
+    comment_lines, first_semicolons = np.unique(np.searchsorted(line_ends, semicolons), return_index=True)
+    comment_starts[comment_lines] = semicolons[first_semicolons]
+
+    is_code: np.ndarray = word_starts < comment_starts[word_lines]
+    word_starts: np.ndarray = word_starts[is_code]
+    word_lines: np.ndarray = word_lines[is_code]
+    word_stops: np.ndarray = separators[np.searchsorted(separators, word_starts + 1)]
+
+    letters: np.ndarray = data[word_starts]
+    values: np.ndarray = parse_numbers(data, word_starts + 1, word_stops)
+
+    is_first: np.ndarray = np.ones(len(word_lines), dtype=bool)
+    is_first[1:] = word_lines[1:] != word_lines[:-1]
+    is_command: np.ndarray = is_first & np.isin(letters, _COMMANDS) & ~np.isnan(values)
+
+    type_starts: np.ndarray = find_markers(data, semicolons, TYPE_MARKER)
+    type_lines: np.ndarray = np.searchsorted(line_ends, type_starts)
+    width_starts: np.ndarray = find_markers(data, semicolons, WIDTH_MARKER)
+    width_lines: np.ndarray = np.searchsorted(line_ends, width_starts)
+
+    is_row: np.ndarray = np.zeros(len(line_ends), dtype=bool)
+    is_row[word_lines[is_command]] = True
+    is_row[type_lines] = True
+    is_row[width_lines] = True
+    line_rows: np.ndarray = np.cumsum(is_row) - 1
+
+    table: np.ndarray = np.full(int(is_row.sum()), _EMPTY_ROW, dtype=TABLE)
+    table[LETTER][line_rows[word_lines[is_command]]] = letters[is_command]
+    table[NUMBER][line_rows[word_lines[is_command]]] = values[is_command]
+
+    table[LETTER][line_rows[type_lines]] = ord(";")
+    table[TYPE][line_rows[type_lines]] = [
+        _FEATURE_CODES.get(bytes(data[start + len(TYPE_MARKER):stop]).strip(), -1)
+        for start, stop in zip(type_starts, line_ends[type_lines])
+    ]
+    table[LETTER][line_rows[width_lines]] = ord(";")
+    table[WIDTH][line_rows[width_lines]] = parse_numbers(data, width_starts + len(WIDTH_MARKER),
+                                                         line_ends[width_lines])
+
+    command_lines: np.ndarray = np.full(len(line_ends), -1)
+    command_lines[word_lines[is_command]] = line_rows[word_lines[is_command]]
+    param_rows: np.ndarray = command_lines[word_lines]
+
+    for letter, column in _PARAMS.items():
+        is_param: np.ndarray = ~is_first & (letters == letter) & (param_rows >= 0)
+        table[column][param_rows[is_param]] = values[is_param]
+
+    return table
+
+
+def tokenize_blocks(buffer: bytes | mmap.mmap, start: int = 0, stop: Optional[int] = None,
+                    block_size: int = BLOCK_SIZE) -> np.ndarray:
+    stop: int = len(buffer) if stop is None else stop
+    tables: list[np.ndarray] = []
+
+    with memoryview(buffer) as view:
+        while stop - start > block_size:
+            split: int = buffer.rfind(b"\n", start, start + block_size) + 1
+            if split <= start:
+                split: int = buffer.find(b"\n", start + block_size, stop) + 1 or stop
+            tables.append(tokenize(view[start:split]))
+            start: int = split
+        tables.append(tokenize(view[start:stop]))
+
+    return np.concatenate(tables)
+
+
+def tokenize_file(file: BinaryIO, block_size: int = BLOCK_SIZE) -> np.ndarray:
+    tables: list[np.ndarray] = []
+    rest: bytes = b""
+
+    while True:
+        block: bytes = file.read(block_size)
+        if not block:
+            break
+
+        block: bytes = rest + block
+        split: int = block.rfind(b"\n") + 1
+        if split == 0:
+            rest: bytes = block
+            continue
+
+        tables.append(tokenize(block[:split]))
+        rest: bytes = block[split:]
+
+    tables.append(tokenize(rest))
+    return np.concatenate(tables)
+
+
+def layer_ranges(buffer: mmap.mmap, chunks: int) -> list[tuple[int, int]]:
+    markers: list[int] = [0]
+    marker: int = buffer.find(LAYER_MARKER)
+    while marker >= 0:
+        if marker > markers[-1]:
+            markers.append(marker)
+        marker: int = buffer.find(LAYER_MARKER, marker + len(LAYER_MARKER))
+    markers.append(len(buffer))
+
+    chunk_size: int = max(len(buffer) // max(chunks, 1), BLOCK_SIZE)
+    ranges: list[tuple[int, int]] = []
+    start: int = 0
+    for stop in markers[1:]:
+        if stop - start >= chunk_size or stop == len(buffer):
+            ranges.append((start, stop))
+            start: int = stop
+    return ranges
+
+
+def tokenize_range(file: str, start: int, stop: int) -> np.ndarray:
+    with open(file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        return tokenize_blocks(buffer, start, stop)
+
+
+def python_executable() -> Optional[str]:
+    executable: str = sys.executable
+    if "freecad" in os.path.basename(executable).lower():
+        executable: str = os.path.join(os.path.dirname(executable), "python.exe" if os.name == "nt" else "python")
+    return executable if os.path.isfile(executable) else None
+
+
+def tokenize_layers(file: str, processes: Optional[int] = None) -> np.ndarray:
+    size: int = os.path.getsize(file)
+    executable: Optional[str] = python_executable()
+    workers: int = processes or os.cpu_count() or 1
+
+    if size < PARALLEL_SIZE or workers < 2 or executable is None:
+        with open(file, "rb") as f:
+            return tokenize_file(f)
+
+    with open(file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        ranges: list[tuple[int, int]] = layer_ranges(buffer, workers * 4)
+
+    context: multiprocessing.context.SpawnContext = multiprocessing.get_context("spawn")
+    context.set_executable(executable)
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges)), mp_context=context) as pool:
+        tables: list[np.ndarray] = list(pool.map(tokenize_range, repeat(file), *zip(*ranges)))
+
+    return np.concatenate(tables)
+
+
+class GcodeStream:
+    def __init__(self, file: str, source: Optional[str] = None) -> None:
+        self._file: str = file
+        self._source: str = source if source is not None else file + ".tmp"
+        self._offset: int = 0
+        self._rest: bytes = b""
+        self._digest: hashlib.sha1 = hashlib.sha1()
+        self._tables: list[np.ndarray] = []
+
+    @property
+    def table(self) -> np.ndarray:
+        if len(self._tables) > 1:
+            self._tables: list[np.ndarray] = [np.concatenate(self._tables)]
+        return self._tables[0] if self._tables else np.empty(0, dtype=TABLE)
+
+    def clear(self) -> None:
+        if self._source != self._file and os.path.exists(self._source):
+            os.remove(self._source)
+
+    def consume(self, data: bytes, final: bool = False) -> bool:
+        self._offset += len(data)
+        self._digest.update(data)
+
+        buffer: bytes = self._rest + data
+        split: int = len(buffer) if final else buffer.rfind(LAYER_MARKER)
+        if split <= 0:
+            self._rest: bytes = buffer
+            return False
+
+        self._tables.append(tokenize_blocks(buffer, 0, split))
+        self._rest: bytes = buffer[split:]
+        return True
+
+    def feed(self) -> bool:
+        try:
+            with open(self._source, "rb") as f:
+                f.seek(self._offset)
+                data: bytes = f.read()
+        except OSError:
+            return False
+
+        return self.consume(data)
+
+    def finish(self) -> np.ndarray:
+        digest: hashlib.sha1 = hashlib.sha1()
+        with open(self._file, "rb") as f:
+            remaining: int = self._offset
+            while remaining > 0:
+                block: bytes = f.read(min(remaining, BLOCK_SIZE))
+                if not block:
+                    break
+                digest.update(block)
+                remaining -= len(block)
+
+            if remaining == 0 and digest.digest() == self._digest.digest():
+                self.consume(f.read(), final=True)
+                return self.table
+
+        self._tables: list[np.ndarray] = [tokenize_layers(self._file)]
+        return self.table
+
+
+def forward_fill(values: np.ndarray, initial: float = 0.) -> np.ndarray:
+    filled: np.ndarray = np.concatenate([[initial], values])
+    ids: np.ndarray = np.where(np.isnan(filled), 0, np.arange(len(filled)))
+    return filled[np.maximum.accumulate(ids)][1:]
+
+
+def split_arcs(moves: np.ndarray, positions: np.ndarray,
+               is_arc: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    starts: np.ndarray = np.concatenate([np.zeros((1, 3)), positions[:-1]])
+    centers: np.ndarray = starts[:, :2] + np.nan_to_num(np.column_stack([moves[I], moves[J]]))
+    radii: np.ndarray = np.linalg.norm(starts[:, :2] - centers, axis=1)
+    first_angles: np.ndarray = np.arctan2(starts[:, 1] - centers[:, 1], starts[:, 0] - centers[:, 0])
+    last_angles: np.ndarray = np.arctan2(positions[:, 1] - centers[:, 1], positions[:, 0] - centers[:, 0])
+
+    deltas: np.ndarray = (last_angles - first_angles) % (2 * np.pi)
+    sweeps: np.ndarray = np.where(moves[NUMBER] == 2, np.where(deltas > 0, deltas - 2 * np.pi, -2 * np.pi),
+                                  np.where(deltas > 0, deltas, 2 * np.pi))
+    pieces: np.ndarray = np.where(is_arc & (np.abs(sweeps) > np.pi), 2, 1)
+    lengths: np.ndarray = np.where(is_arc, radii * np.abs(sweeps), np.linalg.norm(positions - starts, axis=1))
+
+    rows: np.ndarray = np.repeat(np.arange(len(moves)), pieces)
+    piece_ids: np.ndarray = np.arange(len(rows)) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+    is_inner: np.ndarray = piece_ids < pieces[rows] - 1
+
+    def arc_points(fractions: np.ndarray) -> np.ndarray:
+        angles: np.ndarray = first_angles[rows] + sweeps[rows] * fractions
+        return np.column_stack([centers[rows, 0] + radii[rows] * np.cos(angles),
+                                centers[rows, 1] + radii[rows] * np.sin(angles),
+                                starts[rows, 2] + (positions[rows, 2] - starts[rows, 2]) * fractions])
+
+    split_positions: np.ndarray = positions[rows]
+    split_positions[is_inner] = arc_points((piece_ids + 1.) / pieces[rows])[is_inner]
+    vias: np.ndarray = np.where(is_arc[rows, np.newaxis], arc_points((piece_ids + .5) / pieces[rows]), np.nan)
+
+    split_moves: np.ndarray = moves[rows]
+    split_moves[Z][is_inner] = np.nan
+    return split_moves, split_positions, vias, is_inner, lengths[rows], rows
+
+
+def extrusion_amounts(table: np.ndarray) -> np.ndarray:
+    is_m: np.ndarray = table[LETTER] == ord("M")
+    modes: np.ndarray = np.full(len(table), np.nan)
+    modes[is_m & (table[NUMBER] == 82)] = 0.
+    modes[is_m & (table[NUMBER] == 83)] = 1.
+    is_relative: np.ndarray = forward_fill(modes) > 0
+
+    is_axis: np.ndarray = (table[LETTER] == ord("G")) & np.isin(table[NUMBER], (0, 1, 2, 3, 92))
+    values: np.ndarray = np.where(is_axis, table[E], np.nan)
+    positions: np.ndarray = forward_fill(np.where(is_relative, np.nan, values))
+    return np.nan_to_num(np.where(is_relative, values, values - np.concatenate([[0.], positions[:-1]])))
+
+
+def assemble(table: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray, dict[str, np.ndarray]]:
+    is_marker: np.ndarray = table[LETTER] == ord(";")
+    channels: dict[int, np.ndarray] = {
+        F: forward_fill(table[F], np.nan), WIDTH: forward_fill(table[WIDTH], np.nan),
+        TYPE: forward_fill(np.where(table[TYPE] == _NO_TYPE, np.nan, table[TYPE]), -1.)
+    }
+    table: np.ndarray = table[~is_marker]
+    for column, values in channels.items():
+        table[column] = values[~is_marker]
+
+    has_extrusion: np.ndarray = table[E] > 0
+    table[E] = extrusion_amounts(table)
+    next_has_extrusion: np.ndarray = np.append(has_extrusion[1:], False)
+
+    is_move: np.ndarray = table[LETTER] == ord("G")
+    this_has_extrusion: np.ndarray = has_extrusion[is_move]
+    next_has_extrusion: np.ndarray = next_has_extrusion[is_move]
+    moves: np.ndarray = table[is_move]
+
+    positions: np.ndarray = np.column_stack([forward_fill(moves[X]), forward_fill(moves[Y]),
+                                             forward_fill(moves[Z])])
+    move_lengths: np.ndarray = np.linalg.norm(np.diff(positions, axis=0, prepend=np.zeros((1, 3))), axis=1)
+    vias: Optional[np.ndarray] = None
+
+    is_arc: np.ndarray = np.isin(moves[NUMBER], (2, 3)) & ~(np.isnan(moves[I]) & np.isnan(moves[J]))
+    if np.any(is_arc):
+        moves, positions, vias, is_inner, move_lengths, rows = split_arcs(moves, positions, is_arc)
+        this_has_extrusion: np.ndarray = this_has_extrusion[rows]
+        next_has_extrusion: np.ndarray = np.where(is_inner, this_has_extrusion, next_has_extrusion[rows])
+
+    is_point: np.ndarray = this_has_extrusion | next_has_extrusion
+    is_break: np.ndarray = ~(this_has_extrusion & next_has_extrusion)
+    points: np.ndarray = positions[is_point]
+
+    # A break only closes the pending path if it holds more than one point, a single point is carried over.
+    point_counts: np.ndarray = np.cumsum(is_point)[is_break]
+    added: np.ndarray = np.diff(point_counts, prepend=0)
+    is_many: np.ndarray = added > 1
+    single_counts: np.ndarray = np.cumsum(added == 1)
+    single_offsets: np.ndarray = np.concatenate([[0], single_counts[is_many]])[np.cumsum(is_many)]
+    is_flush: np.ndarray = is_many | ((added == 1) & ((single_counts - single_offsets) % 2 == 0))
+
+    path_offsets: np.ndarray = np.concatenate([[0], point_counts[is_flush]])
+    path_counts: np.ndarray = np.cumsum(is_flush)[~np.isnan(moves[Z][is_break])]
+    layer_offsets: np.ndarray = np.unique(np.concatenate([[0], path_counts, [len(path_offsets) - 1]]))
+
+    starts: np.ndarray = path_offsets[:-1]
+    stops: np.ndarray = path_offsets[1:]
+    is_closed: np.ndarray = np.linalg.norm(points[starts] - points[stops - 1], axis=1) < 2
+
+    lengths: np.ndarray = stops - starts + is_closed
+    closed_offsets: np.ndarray = np.concatenate([[0], np.cumsum(lengths)])
+    local_ids: np.ndarray = np.arange(closed_offsets[-1]) - np.repeat(closed_offsets[:-1], lengths)
+    local_ids[closed_offsets[1:][is_closed] - 1] = 0
+    ids: np.ndarray = np.repeat(starts, lengths) + local_ids
+
+    # Path starts are reached by travel moves and closing points are added, both take the attributes of the path.
+    attribute_ids: np.ndarray = ids.copy()
+    attribute_ids[closed_offsets[:-1]] = np.minimum(starts + 1, stops - 1)
+    attribute_ids[closed_offsets[1:][is_closed] - 1] = stops[is_closed] - 1
+
+    flows: np.ndarray = np.divide(moves[E], move_lengths, out=np.zeros(len(moves)), where=move_lengths > 0)
+    attributes: dict[str, np.ndarray] = {
+        "feed": moves[F][is_point][attribute_ids], "extrusion": flows[is_point][attribute_ids],
+        "type": moves[TYPE][is_point][attribute_ids].astype(np.int64),
+        "width": moves[WIDTH][is_point][attribute_ids].astype(np.float64)
+    }
+    if vias is not None:
+        attributes["arc_via"] = vias[is_point][ids]
+        attributes["arc_via"][closed_offsets[1:][is_closed] - 1] = np.nan
+
+    return points[ids], closed_offsets, layer_offsets, attributes
@@ -13,10 +13,12 @@ import FreeCAD as App
 import Part
 
 from utils import kinematic_part_iterator, kinematic_chain
+from throttle import Throttle, RATE
 
 
 class RobotController:
     AXIS_LABELS: list[str] = ["aA1", "bA2", "cA3", "dA4", "eA5", "fA6"]
+    UPDATE_RATE: float = RATE
 
     def __init__(self, feature_obj: Part.Feature, robot_grp: App.DocumentObjectGroup) -> None:
         feature_obj.addProperty("App::PropertyLink", "aRobot", "Kinematic", "Robot kinematic")
@@ -71,6 +73,22 @@ class RobotController:
                 # noinspection PyPep8Naming
                 self._kinematic_parts[i].Placement.Rotation.Angle = (axis_rad[i] + self._axis_offset_rad[i])
 
+    @property
+    def axes(self) -> Throttle:
+        if getattr(self, "_axes", None) is None:
+            self._axes: Optional[Throttle] = Throttle(self.apply_axes, self.UPDATE_RATE)
+        return self._axes
+
+    def apply_axes(self) -> None:
+        if type(self._kinematic_parts) is list and len(self._kinematic_parts) == 7:
+            for idx, axis_prop in enumerate(self.AXIS_LABELS):
+                if hasattr(self._feature_obj, axis_prop):
+                    angle_rad: float = radians(self._feature_obj.getPropertyByName(axis_prop))
+                    self._kinematic_parts[idx].Placement.Rotation.Angle = angle_rad
+
+            if hasattr(self._feature_obj, "aPoint"):
+                self._feature_obj.aPoint = self._kinematic_parts[-1].getGlobalPlacement().Base
+
     def reset_axis(self) -> None:
         if hasattr(self, "_axis_offset_rad") and type(self._axis_offset_rad) is np.ndarray:
             self.set_axis(-self._axis_offset_rad)
@@ -106,12 +124,7 @@ class RobotController:
 
         if prop in self.AXIS_LABELS and type(self._kinematic_parts) is list and len(self._kinematic_parts) == 7:
             if hasattr(feature_obj, "bMode") and feature_obj.getPropertyByName("bMode") == "Forward":
-                idx: int = self.AXIS_LABELS.index(prop)
-                angle_rad: float = radians(feature_obj.getPropertyByName(prop))
-                self._kinematic_parts[idx].Placement.Rotation.Angle = angle_rad
-
-                if hasattr(feature_obj, "aPoint"):
-                    feature_obj.aPoint = self._kinematic_parts[-1].getGlobalPlacement().Base
+                self.axes.request()
 
         if prop in ("aPoint", "bRotation") and hasattr(feature_obj, "aPoint") and hasattr(feature_obj, "bRotation"):
             if hasattr(feature_obj, "bMode") and feature_obj.getPropertyByName("bMode") == "Inverse":
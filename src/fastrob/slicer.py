@@ -1,11 +1,13 @@
 from __future__ import annotations
-from typing import Optional, cast
+from typing import Any, Callable, Optional, cast
+from collections import OrderedDict
 
 import os
 import sys
-import subprocess
+import base64
 import importlib
 
+import numpy as np
 import awkward as ak
 
 import PySide2.QtCore as QtCore
@@ -15,19 +17,29 @@ import FreeCADGui as Gui
 import FreeCAD as App
 import Part
 import Mesh
+from pivy import coin
 
 if os.getcwd() not in sys.path:
     sys.path.append(os.getcwd())
 
 import utils
 importlib.reload(utils)
-from utils import (slice_stl, parse_g_code, discretize_paths, shift_paths, axis_offset, clamp_paths,
-                   make_wires)  # noqa
+from utils import (slice_command, slice_key, g_code_paths, discretize_paths, shift_paths, axis_offset, clamp_paths,
+                   vectors, make_wires, path_colors)  # noqa
+from cache import SliceCache  # noqa
+from gcode import GcodeStream, FEATURE_TYPES  # noqa
+from toolpath import Toolpath, DetailPyramid, tessellate, concatenate  # noqa
+from throttle import Throttle, RATE  # noqa
+
+
+CACHE_POINTS: int = 1 << 21
+STATE_PREFIX: str = "npz+zlib:"
+STATE_SEPARATOR: str = ","
 
 
 class ValueSlider(QtWidgets.QWidget):
     def __init__(self, label: str, feature_obj: Part.Feature, prop: str, min_max: tuple[int, int],
-                 value: int, parent: QtWidgets.QWidget = None):
+                 value: int, parent: QtWidgets.QWidget = None, rate: float = RATE):
         super().__init__(parent)
 
         self.setWindowTitle("Value Slider")
@@ -51,12 +63,217 @@ class ValueSlider(QtWidgets.QWidget):
 
         self._feature_obj: Part.Feature = feature_obj
         self._prop: str = prop
+        self._throttle: Throttle = Throttle(self.apply, rate, self)
 
         cast(QtCore.SignalInstance, self._slider.valueChanged).connect(self.on_value_change)
+        cast(QtCore.SignalInstance, self._slider.sliderReleased).connect(self._throttle.flush)
 
-    def on_value_change(self) -> None:
+    def apply(self) -> None:
         setattr(self._feature_obj, self._prop, int(self._slider.value()))
+
+    def on_value_change(self) -> None:
         self._info_label.setText(str(self._slider.value()))
+        self._throttle.request()
+
+    # noinspection PyPep8Naming
+    def closeEvent(self, event: QtCore.QEvent) -> None:
+        self._throttle.flush()
+        super().closeEvent(event)
+
+
+class SliceJob(QtCore.QObject):
+    done: QtCore.Signal = QtCore.Signal(object)
+    progress: QtCore.Signal = QtCore.Signal(object)
+
+    def __init__(self, key: str, cmd: list[str], g_code_file: str, poll_interval: int = 500) -> None:
+        super().__init__()
+
+        self.key: str = key
+        self.result: Optional[np.ndarray] = None
+        self.preview: list[Part.Shape] = []
+        self.preview_layers: int = 0
+        self._stream: GcodeStream = GcodeStream(g_code_file)
+        self._errors: str = ""
+        self._cancelled: bool = False
+
+        self._timer: QtCore.QTimer = QtCore.QTimer(self)
+        self._timer.setInterval(poll_interval)
+        cast(QtCore.SignalInstance, self._timer.timeout).connect(self.on_poll)
+
+        self._process: QtCore.QProcess = QtCore.QProcess(self)
+        self._process.setProgram(cmd[0])
+        self._process.setArguments(cmd[1:])
+
+        cast(QtCore.SignalInstance, self._process.readyReadStandardOutput).connect(self.on_output)
+        cast(QtCore.SignalInstance, self._process.readyReadStandardError).connect(self.on_error_output)
+        cast(QtCore.SignalInstance, self._process.finished).connect(self.on_finished)
+        cast(QtCore.SignalInstance, self._process.errorOccurred).connect(self.on_error)
+
+    @property
+    def running(self) -> bool:
+        return self._process.state() != QtCore.QProcess.NotRunning
+
+    @property
+    def table(self) -> np.ndarray:
+        return self._stream.table
+
+    def start(self) -> None:
+        self._stream.clear()
+        self._process.start()
+        self._timer.start()
+
+    def cancel(self) -> None:
+        self._cancelled: bool = True
+        self._timer.stop()
+        if self.running:
+            self._process.kill()
+            self._process.waitForFinished(1000)
+
+    def on_output(self) -> None:
+        output: str = bytes(self._process.readAllStandardOutput()).decode(errors="replace")
+        for line in output.splitlines():
+            if line.strip():
+                print(line)
+                Gui.getMainWindow().statusBar().showMessage("Slicing: " + line.strip())
+
+    def on_poll(self) -> None:
+        if self._stream.feed():
+            cast(QtCore.SignalInstance, self.progress).emit(self)
+
+    def on_error_output(self) -> None:
+        self._errors += bytes(self._process.readAllStandardError()).decode(errors="replace")
+
+    def on_finished(self, exit_code: int, exit_status: QtCore.QProcess.ExitStatus) -> None:
+        self._timer.stop()
+        if self._cancelled:
+            return
+
+        print(self._errors)
+        if exit_status == QtCore.QProcess.NormalExit and exit_code == 0 and not self._errors:
+            try:
+                self.result: Optional[np.ndarray] = self._stream.finish()
+            except OSError as e:
+                print(e)
+
+        Gui.getMainWindow().statusBar().clearMessage()
+        cast(QtCore.SignalInstance, self.done).emit(self)
+
+    def on_error(self, error: QtCore.QProcess.ProcessError) -> None:
+        if error == QtCore.QProcess.FailedToStart and not self._cancelled:
+            self._timer.stop()
+            print("Slicer failed to start:", self._process.errorString())
+            cast(QtCore.SignalInstance, self.done).emit(self)
+
+
+class Stage:
+    def __init__(self, func: Callable[..., Any]) -> None:
+        self._func: Callable[..., Any] = func
+        self._inputs: Optional[tuple] = None
+        self._output: Any = None
+
+    @staticmethod
+    def same(a: Any, b: Any) -> bool:
+        return a is b or (not isinstance(a, (Toolpath, np.ndarray)) and type(a) is type(b) and a == b)
+
+    def __call__(self, *inputs: Any) -> Any:
+        if (self._inputs is None or len(inputs) != len(self._inputs) or
+                not all(self.same(a, b) for a, b in zip(inputs, self._inputs))):
+            self._output: Any = self._func(*inputs)
+            self._inputs: Optional[tuple] = inputs if self._output is not None else None
+
+        return self._output
+
+    def reset(self) -> None:
+        self._inputs: Optional[tuple] = None
+        self._output: Any = None
+
+
+class DisplayCache:
+    def __init__(self, paths: Toolpath, max_points: int = CACHE_POINTS) -> None:
+        self.paths: Toolpath = paths
+        self.tessellated: Toolpath = tessellate(paths)
+        self._max_points: int = max_points
+        self._entries: OrderedDict[tuple, tuple[Any, int]] = OrderedDict()
+        self._size: int = 0
+        self._levels: Optional[tuple[tuple, Toolpath, Optional[Part.Shape]]] = None
+
+    def cached(self, key: tuple, build: Callable[[], Any], size: int | Callable[[Any], int]) -> Any:
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+        value: Any = build()
+        size: int = size(value) if callable(size) else size
+        self._entries[key] = (value, size)
+        self._size += size
+
+        while self._size > self._max_points and len(self._entries) > 1:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._size -= evicted_size
+        return value
+
+    def path_shape(self, idx: int, count: Optional[int] = None) -> Optional[Part.Shape]:
+        length: int = int(self.paths.path_lengths[idx])
+        if count is not None and count < length:
+            partial: Toolpath = tessellate(self.paths.view(idx, idx + 1, np.array([0, 1]), count))
+            return Part.makePolygon(vectors(partial.points)) if count > 1 else None
+
+        return self.cached(("path", idx), lambda: Part.makePolygon(vectors(self.tessellated.path(idx)))
+                           if length > 1 else None, int(self.tessellated.path_lengths[idx]))
+
+    def path_shapes(self, first: int, last: int) -> list[Part.Shape]:
+        shapes: list[Optional[Part.Shape]] = [self.path_shape(idx) for idx in range(first, last)]
+        return [shape for shape in shapes if shape is not None]
+
+    def layer_shape(self, idx: int) -> Optional[Part.Shape]:
+        def build() -> Optional[Part.Shape]:
+            shapes: list[Part.Shape] = self.path_shapes(int(self.paths.layer_offsets[idx]),
+                                                        int(self.paths.layer_offsets[idx + 1]))
+            return Part.makeCompound(shapes) if shapes else None
+
+        return self.cached(("layer", idx), build, self.paths.layer_point_count(idx))
+
+    def range_shape(self, first: int, last: int) -> Part.Shape:
+        shapes: list[Optional[Part.Shape]] = [self.layer_shape(idx) for idx in range(first, last + 1)]
+        shapes: list[Part.Shape] = [shape for shape in shapes if shape is not None]
+        return Part.makeCompound(shapes) if shapes else Part.Shape()
+
+    def level_layer(self, idx: int, level: int, tolerance: float) -> Toolpath:
+        return self.cached(("level", idx, level, tolerance),
+                           lambda: DetailPyramid(self.paths.layer(idx), tolerance).level(level),
+                           lambda layer: layer.point_count)
+
+    def level_shape(self, idx: int, level: int, tolerance: float) -> Optional[Part.Shape]:
+        def build() -> Optional[Part.Shape]:
+            shape: Part.Shape = make_wires(self.level_layer(idx, level, tolerance))
+            return shape if not shape.isNull() else None
+
+        return self.cached(("level_shape", idx, level, tolerance), build,
+                           lambda _: self.level_layer(idx, level, tolerance).point_count)
+
+    def level_range(self, first: int, last: int, level: int, tolerance: float,
+                    shape: bool) -> tuple[Toolpath, Optional[Part.Shape]]:
+        key: tuple = (first, last, level, tolerance)
+        if self._levels is None or self._levels[0] != key or (shape and self._levels[2] is None):
+            layers: Toolpath = concatenate([self.level_layer(idx, level, tolerance) for idx in range(first, last + 1)])
+            compound: Optional[Part.Shape] = None
+            if shape:
+                shapes: list[Optional[Part.Shape]] = [self.level_shape(idx, level, tolerance)
+                                                      for idx in range(first, last + 1)]
+                shapes: list[Part.Shape] = [layer_shape for layer_shape in shapes if layer_shape is not None]
+                compound: Optional[Part.Shape] = Part.makeCompound(shapes) if shapes else Part.Shape()
+            self._levels: Optional[tuple[tuple, Toolpath, Optional[Part.Shape]]] = (key, layers, compound)
+        return self._levels[1], self._levels[2]
+
+    def render(self, first_layer: int, point_idx: int) -> Part.Shape:
+        layer_idx, path_idx, offset = self.paths.locate(point_idx)
+
+        shapes: list[Optional[Part.Shape]] = [self.layer_shape(idx) for idx in range(first_layer, layer_idx)]
+        shapes.extend(self.path_shapes(int(self.paths.layer_offsets[layer_idx]), path_idx))
+        shapes.append(self.path_shape(path_idx, offset + 1))
+
+        shapes: list[Part.Shape] = [shape for shape in shapes if shape is not None]
+        return Part.makeCompound(shapes) if shapes else Part.Shape()
 
 
 class Slicer:
@@ -72,18 +289,29 @@ class Slicer:
         feature_obj.addProperty("App::PropertyVector", "iAxisOffset", "Slicer", "Additional offset before/after path")
         feature_obj.addProperty("App::PropertyInteger", "jDiscretize", "Slicer", "Distance between path points")
         feature_obj.addProperty("App::PropertyIntegerList", "kSeamShifts", "Slicer", "Shift of the perimeter seams")
+        feature_obj.addProperty("App::PropertyBool", "lArcFitting", "Slicer", "True fits arcs (G2/G3) to the paths")
 
         feature_obj.addProperty("App::PropertyEnumeration", "aMode", "Filter", "Mode of the path filter")
         feature_obj.addProperty("App::PropertyInteger", "bLayerIndex", "Filter", "Layer to be filtered")
         feature_obj.setPropertyStatus("bLayerIndex", "UserEdit")
         feature_obj.addProperty("App::PropertyInteger", "cPointIndex", "Filter", "Position to be filtered")
         feature_obj.setPropertyStatus("cPointIndex", "UserEdit")
+        feature_obj.addProperty("App::PropertyInteger", "dLastLayer", "Filter", "Last layer of the filtered range")
+        feature_obj.setPropertyStatus("dLastLayer", "UserEdit")
+        feature_obj.addProperty("App::PropertyStringList", "eTypes", "Filter", "Feature types to be filtered")
 
         feature_obj.addProperty("App::PropertyVectorList", "aLocalPoints", "Result", "Points of the filtered layer(s)")
         feature_obj.addProperty("App::PropertyVector", "bLocalPoint", "Result", "Point of the filtered point index")
         feature_obj.addProperty(
             "App::PropertyVector", "cGlobalPoint", "Result", "Point of the filtered point index in global coordinates"
         )
+        feature_obj.addProperty(
+            "App::PropertyInteger", "dWindow", "Result", "Number of trailing points in aLocalPoints (-1 for all)"
+        )
+
+        feature_obj.addProperty("App::PropertyBool", "aShape", "Display", "True builds the B-rep shape of the paths")
+        feature_obj.addProperty("App::PropertyLength", "bTolerance", "Display", "Decimation tolerance of the overview")
+        feature_obj.addProperty("App::PropertyInteger", "cDetailLayers", "Display", "Layers shown at full resolution")
 
         feature_obj.aMesh = mesh
         feature_obj.bHeight = 2.
@@ -100,27 +328,152 @@ class Slicer:
         feature_obj.iAxisOffset = (0, 0, 10)
         feature_obj.jDiscretize = 0
         feature_obj.kSeamShifts = []
+        feature_obj.lArcFitting = False
 
-        feature_obj.aMode = ["None", "All", "Layer"]
+        feature_obj.aMode = ["None", "All", "Layer", "Range", "Type"]
         feature_obj.bLayerIndex = 0
         feature_obj.cPointIndex = 0
+        feature_obj.dLastLayer = 0
+        feature_obj.eTypes = ["Perimeter", "External perimeter"]
 
         feature_obj.aLocalPoints = [(0, 0, 0)]
         feature_obj.bLocalPoint = (0, 0, 0)
         feature_obj.cGlobalPoint = (0, 0, 0)
+        feature_obj.dWindow = 0
+
+        feature_obj.aShape = False
+        feature_obj.bTolerance = .1
+        feature_obj.cDetailLayers = 10
 
         feature_obj.Proxy = self
         self._feature_obj: Part.Feature = feature_obj
 
         self._slider: Optional[ValueSlider] = None
-        self._paths: Optional[ak.Array] = None
+        self._paths: Optional[Toolpath] = None
+        self._visible: Optional[Toolpath] = None
+        self._job: Optional[SliceJob] = None
 
     @property
-    def paths(self) -> Optional[ak.Array]:
+    def _paths(self) -> Optional[Toolpath]:
+        if getattr(self, "_state", None) is not None:
+            paths_state: str = self._state[len(STATE_PREFIX):].split(STATE_SEPARATOR)[0]
+            paths: Toolpath = Toolpath.from_bytes(base64.b64decode(paths_state))
+            if getattr(self, "_overview", None) is None:
+                self._overview: Optional[Toolpath] = self.stored_overview()
+            self._state: Optional[str] = None
+            self._toolpath: Optional[Toolpath] = paths if paths.point_count > 0 else None
+        return getattr(self, "_toolpath", None)
+
+    @_paths.setter
+    def _paths(self, paths: Optional[Toolpath]) -> None:
+        self._state: Optional[str] = None
+        self._toolpath: Optional[Toolpath] = paths
+        self._overview: Optional[Toolpath] = None
+
+    def stored_overview(self) -> Optional[Toolpath]:
+        if getattr(self, "_state", None) is None or STATE_SEPARATOR not in self._state:
+            return None
+        overview: Toolpath = Toolpath.from_bytes(base64.b64decode(self._state.split(STATE_SEPARATOR, 1)[1]))
+        return overview if overview.point_count > 0 else None
+
+    @property
+    def paths(self) -> Optional[Toolpath]:
         return self._paths
 
+    @property
+    def visible(self) -> Optional[Toolpath]:
+        visible: Optional[Toolpath] = getattr(self, "_visible", None)
+        return visible if visible is not None else self._paths
+
+    @property
+    def display_cache(self) -> Optional[DisplayCache]:
+        if self._paths is None:
+            return None
+        if getattr(self, "_display_cache", None) is None or self._display_cache.paths is not self._paths:
+            self._display_cache: Optional[DisplayCache] = DisplayCache(self._paths)
+        return self._display_cache
+
+    @property
+    def type_index(self) -> dict[int, np.ndarray]:
+        if self._paths is None:
+            return {}
+        if getattr(self, "_type_index", None) is None or self._type_index[0] is not self._paths:
+            self._type_index: Optional[tuple[Toolpath, dict[int, np.ndarray]]] = (
+                self._paths, self._paths.path_index("type")
+            )
+        return self._type_index[1]
+
+    def selected(self, feature_obj: Part.Feature) -> Optional[Toolpath]:
+        if self._paths is None or not hasattr(feature_obj, "eTypes"):
+            return self._paths
+        if feature_obj.getPropertyByName("aMode") != "Type":
+            return self._paths
+
+        index: dict[int, np.ndarray] = self.type_index
+        path_ids: list[np.ndarray] = [index[code] for code, name in enumerate(FEATURE_TYPES)
+                                      if name in feature_obj.getPropertyByName("eTypes") and code in index]
+        return self._paths.select(np.sort(np.concatenate(path_ids)) if path_ids else np.zeros(0, dtype=np.int64))
+
+    def pyramid(self, tolerance: float) -> Optional[DetailPyramid]:
+        if self._paths is None:
+            return None
+        if (getattr(self, "_pyramid", None) is None or self._pyramid.paths is not self._paths or
+                self._pyramid.tolerance != tolerance):
+            self._pyramid: Optional[DetailPyramid] = DetailPyramid(self._paths, tolerance)
+        return self._pyramid
+
+    def overview(self, feature_obj: Part.Feature) -> Toolpath:
+        if not hasattr(feature_obj, "bTolerance") or not hasattr(feature_obj, "cDetailLayers"):
+            return tessellate(self._paths)
+        return self.pyramid(float(feature_obj.bTolerance)).select(len(self._paths),
+                                                                  int(feature_obj.cDetailLayers))
+
+    def level_index(self, feature_obj: Part.Feature, layer_count: int) -> int:
+        if not hasattr(feature_obj, "bTolerance") or not hasattr(feature_obj, "cDetailLayers"):
+            return 0
+        return self.pyramid(float(feature_obj.bTolerance)).level_index(layer_count, int(feature_obj.cDetailLayers))
+
+    @property
+    def recompute(self) -> Throttle:
+        if getattr(self, "_recompute", None) is None:
+            self._recompute: Optional[Throttle] = Throttle(self._feature_obj.Document.recompute)
+        return self._recompute
+
+    @property
+    def stages(self) -> dict[str, Stage]:
+        if not hasattr(self, "_stages"):
+            self._stages: dict[str, Stage] = {
+                "slice": Stage(self.slice),
+                "parse": Stage(self.parse),
+                "discretize": Stage(discretize_paths),
+                "shift": Stage(shift_paths),
+                "offset": Stage(axis_offset),
+                "display": Stage(self.display)
+            }
+        return self._stages
+
+    @staticmethod
+    def builds_shape(feature_obj: Part.Feature) -> bool:
+        return not hasattr(feature_obj, "aShape") or bool(feature_obj.getPropertyByName("aShape"))
+
+    def show(self, feature_obj: Part.Feature, paths: Optional[Toolpath], shape: Optional[Part.Shape] = None) -> None:
+        self._visible: Optional[Toolpath] = paths
+        feature_obj.Shape = shape if shape is not None else Part.Shape()
+
+    @staticmethod
+    def write_results(feature_obj: Part.Feature, points: np.ndarray) -> None:
+        last: list[float] = points[-1].tolist()
+        window: int = feature_obj.getPropertyByName("dWindow") if hasattr(feature_obj, "dWindow") else -1
+
+        if hasattr(feature_obj, "aLocalPoints"):
+            feature_obj.aLocalPoints = points[max(0, len(points) - window) if window >= 0 else 0:].tolist()
+        if hasattr(feature_obj, "bLocalPoint"):
+            feature_obj.bLocalPoint = last
+        if hasattr(feature_obj, "cGlobalPoint"):
+            feature_obj.cGlobalPoint = feature_obj.getGlobalPlacement().Base + App.Vector(*last)
+
     def reset_properties(self, feature_obj: Part.Feature) -> None:
-        self._paths: Optional[ak.Array] = None
+        self._paths: Optional[Toolpath] = None
 
         if (hasattr(feature_obj, "bLayerIndex") and hasattr(feature_obj, "cPointIndex") and
                 hasattr(feature_obj, "aLocalPoints") and hasattr(feature_obj, "bLocalPoint") and
@@ -131,50 +484,96 @@ class Slicer:
             feature_obj.bLocalPoint = (0, 0, 0)
             feature_obj.cGlobalPoint = (0, 0, 0)
 
-        feature_obj.Shape = Part.Shape()
+        if hasattr(feature_obj, "dLastLayer"):
+            feature_obj.dLastLayer = 0
+
+        self.show(feature_obj, None)
+
+    def slice(self, key: str, mesh: Mesh.Feature, slice_args: tuple) -> Optional[np.ndarray]:
+        if self._job is not None:
+            if self._job.key == key:
+                return self._job.result
+            self._job.cancel()
+
+        temp_path: str = os.path.join(App.getUserAppDataDir(), "fastrob", mesh.Name.lower())
+        Mesh.export([mesh], temp_path + ".stl")
+
+        self._job: Optional[SliceJob] = SliceJob(key, slice_command(temp_path + ".stl", *slice_args),
+                                                 temp_path + ".gcode")
+        cast(QtCore.SignalInstance, self._job.done).connect(self.on_sliced)
+        cast(QtCore.SignalInstance, self._job.progress).connect(self.on_progress)
+        self._job.start()
+        return None
+
+    def on_progress(self, job: SliceJob) -> None:
+        if job is self._job and self._feature_obj.getPropertyByName("aMode") == "None":
+            paths: Toolpath = g_code_paths(job.table)
+            if len(paths) > job.preview_layers:
+                if self.builds_shape(self._feature_obj):
+                    shape: Part.Shape = make_wires(paths.layers(job.preview_layers, len(paths)))
+                    if not shape.isNull():
+                        job.preview.append(shape)
+                    self.show(self._feature_obj, paths, Part.makeCompound(job.preview) if job.preview else None)
+                else:
+                    self.show(self._feature_obj, paths)
+                job.preview_layers: int = len(paths)
+
+    def on_sliced(self, job: SliceJob) -> None:
+        if job is self._job:
+            if job.result is not None:
+                self._feature_obj.touch()
+                self._feature_obj.Document.recompute()
+            else:
+                self._job: Optional[SliceJob] = None
+
+    def parse(self, key: str, mesh: Mesh.Feature, slice_args: tuple) -> Optional[Toolpath]:
+        cache: SliceCache = SliceCache(os.path.join(App.getUserAppDataDir(), "fastrob", "cache"))
+        pending: bool = self._job is not None and self._job.key == key
+        paths: Optional[Toolpath] = None if pending else cache.get(key)
+
+        if paths is None:
+            table: Optional[np.ndarray] = self.stages["slice"](key, mesh, slice_args)
+            if table is not None:
+                paths: Toolpath = g_code_paths(table)
+                cache.put(key, paths)
+                self.stages["slice"].reset()
+                self._job: Optional[SliceJob] = None
+        else:
+            print("Slicing result loaded from cache:", cache.stats)
+
+        return paths
+
+    # noinspection PyMethodMayBeStatic
+    def display(self, paths: Toolpath, shape: bool) -> Optional[Part.Shape]:
+        return make_wires(paths) if shape else None
 
     def execute(self, feature_obj: Part.Feature) -> None:
         if feature_obj.getPropertyByName("aMode") == "None":
             mesh: Mesh.Feature = feature_obj.getPropertyByName("aMesh")
             if mesh is not None:
-                temp_path: str = os.path.join(App.getUserAppDataDir(), "fastrob", mesh.Name.lower())
-                Mesh.export([mesh], temp_path + ".stl")
-
                 # noinspection PyUnresolvedReferences
-                p: subprocess.CompletedProcess = slice_stl(
-                    file=temp_path + ".stl",
-                    layer_height=float(feature_obj.bHeight), seam_width=float(feature_obj.cWidth),
-                    perimeters=int(feature_obj.dPerimeters), fill_pattern=str(feature_obj.ePattern),
-                    fill_density=int(feature_obj.fDensity), infill_angle=float(feature_obj.gAngle),
-                    infill_anchor_max=float(feature_obj.hAnchor)
+                slice_args: tuple = (
+                    float(feature_obj.bHeight), float(feature_obj.cWidth), int(feature_obj.dPerimeters),
+                    str(feature_obj.ePattern), int(feature_obj.fDensity), float(feature_obj.gAngle),
+                    float(feature_obj.hAnchor), bool(getattr(feature_obj, "lArcFitting", False))
                 )
+                paths: Optional[Toolpath] = self.stages["parse"](slice_key(mesh, *slice_args), mesh, slice_args)
 
-                print(p.stdout)
-                print(p.stderr)
-
-                if not p.stderr:
-                    self._paths: Optional[ak.Array] = ak.Array(parse_g_code(file=temp_path + ".gcode"))
-
-                    if self._paths.layout.minmax_depth == (3, 3):
-                        distance: int = feature_obj.getPropertyByName("jDiscretize")
-                        temp_paths: Optional[ak.Array] = discretize_paths(self._paths, distance)
+                if paths is not None and paths.point_count > 0:
+                    distance: int = feature_obj.getPropertyByName("jDiscretize")
+                    temp_paths: Toolpath = self.stages["discretize"](paths, distance)
 
-                        shifts: list[int] = feature_obj.getPropertyByName("kSeamShifts")
-                        temp_paths: Optional[ak.Array] = shift_paths(temp_paths, shifts)
+                    shifts: list[int] = feature_obj.getPropertyByName("kSeamShifts")
+                    temp_paths: Toolpath = self.stages["shift"](temp_paths, shifts)
 
-                        offset: App.Vector = feature_obj.getPropertyByName("iAxisOffset")
-                        self._paths: Optional[ak.Array] = axis_offset(temp_paths, offset)
+                    offset: App.Vector = feature_obj.getPropertyByName("iAxisOffset")
+                    self._paths: Optional[Toolpath] = self.stages["offset"](temp_paths, offset)
 
-                        simplified: ak.Array = ak.flatten(self._paths)
-                        flat: ak.Array = ak.flatten(simplified)
-
-                        feature_obj.aLocalPoints = flat.to_list()
-                        feature_obj.bLocalPoint = flat.to_list()[-1]
-                        feature_obj.cGlobalPoint = (feature_obj.getGlobalPlacement().Base +
-                                                    App.Vector(flat.to_list()[-1]))
-                        feature_obj.Shape = make_wires(simplified)
-                    else:
-                        self.reset_properties(feature_obj)
+                    overview: Toolpath = self.overview(feature_obj)
+                    self._overview: Optional[Toolpath] = overview
+                    shape: Optional[Part.Shape] = self.stages["display"](overview, self.builds_shape(feature_obj))
+                    self.write_results(feature_obj, overview.points)
+                    self.show(feature_obj, overview, shape)
                 else:
                     self.reset_properties(feature_obj)
             else:
@@ -183,29 +582,32 @@ class Slicer:
     # noinspection PyPep8Naming
     def editProperty(self, prop: str) -> None:
         if prop == "bLayerIndex" and self._paths is not None:
-            if self._feature_obj.getPropertyByName("aMode") == "Layer":
+            if self._feature_obj.getPropertyByName("aMode") in ("Layer", "Range"):
                 self._slider: ValueSlider = ValueSlider("Layer Index", self._feature_obj, prop,
                                                         (0, len(self._paths) - 1),
                                                         self._feature_obj.getPropertyByName("bLayerIndex"))
                 self._slider.show()
 
+        elif prop == "dLastLayer" and self._paths is not None:
+            if self._feature_obj.getPropertyByName("aMode") == "Range":
+                self._slider: ValueSlider = ValueSlider("Last Layer", self._feature_obj, prop,
+                                                        (0, len(self._paths) - 1),
+                                                        self._feature_obj.getPropertyByName("dLastLayer"))
+                self._slider.show()
+
         elif prop == "cPointIndex" and self._paths is not None:
             if self._feature_obj.getPropertyByName("aMode") == "All":
-                simplified: ak.Array = ak.flatten(self._paths)
-                flat: ak.Array = ak.flatten(simplified)
-
-                self._slider: ValueSlider = ValueSlider("Point Index", self._feature_obj, prop, (0, len(flat) - 1),
+                self._slider: ValueSlider = ValueSlider("Point Index", self._feature_obj, prop,
+                                                        (0, self._paths.point_count - 1),
                                                         self._feature_obj.getPropertyByName("cPointIndex"))
                 self._slider.show()
 
             elif self._feature_obj.getPropertyByName("aMode") == "Layer":
                 layer_idx: int = self._feature_obj.getPropertyByName("bLayerIndex")
                 clamped_layer_idx = max(0, min(layer_idx, len(self._paths) - 1))
-                layer: ak.Array = self._paths[clamped_layer_idx]
-                flat_layer: ak.Array = ak.flatten(layer)
 
                 self._slider: ValueSlider = ValueSlider("Point Index", self._feature_obj, prop,
-                                                        (0, len(flat_layer) - 1),
+                                                        (0, self._paths.layer_point_count(clamped_layer_idx) - 1),
                                                         self._feature_obj.getPropertyByName("cPointIndex"))
                 self._slider.show()
 
@@ -213,28 +615,22 @@ class Slicer:
     def onChanged(self, feature_obj: Part.Feature, prop: str) -> None:
         if not hasattr(self, "_feature_obj"):
             self._feature_obj: Part.Feature = feature_obj
+            self._job: Optional[SliceJob] = None
+
+        if feature_obj.Document.Restoring:
+            return
 
         if prop == "cPointIndex" and self._paths is not None:
             if hasattr(feature_obj, "aMode") and feature_obj.getPropertyByName("aMode") == "All":
                 point_idx: int = feature_obj.getPropertyByName("cPointIndex")
 
-                simplified: ak.Array = ak.flatten(self._paths)
-                flat: ak.Array = ak.flatten(simplified)
-
-                clamped_point_idx = max(0, min(point_idx, len(flat) - 1))
-                clamped: ak.Array = clamp_paths(self._paths, clamped_point_idx)
-                flat_clamped: ak.Array = ak.flatten(clamped)
+                clamped_point_idx = max(0, min(point_idx, self._paths.point_count - 1))
+                clamped: Toolpath = clamp_paths(self._paths, clamped_point_idx)
+                self.write_results(feature_obj, clamped.points)
 
-                if hasattr(feature_obj, "aLocalPoints"):
-                    feature_obj.aLocalPoints = flat_clamped.to_list()
-                if hasattr(feature_obj, "bLocalPoint"):
-                    feature_obj.bLocalPoint = flat_clamped.to_list()[-1]
-                if hasattr(feature_obj, "cGlobalPoint"):
-                    feature_obj.cGlobalPoint = (feature_obj.getGlobalPlacement().Base +
-                                                App.Vector(flat_clamped.to_list()[-1]))
-
-                feature_obj.Shape = make_wires(clamped)
-                App.ActiveDocument.recompute()
+                self.show(feature_obj, clamped,
+                          self.display_cache.render(0, clamped_point_idx) if self.builds_shape(feature_obj) else None)
+                self.recompute.request()
 
             if hasattr(feature_obj, "aMode") and feature_obj.getPropertyByName("aMode") == "Layer":
                 if hasattr(feature_obj, "bLayerIndex"):
@@ -242,60 +638,195 @@ class Slicer:
                     point_idx: int = feature_obj.getPropertyByName("cPointIndex")
 
                     clamped_layer_idx = max(0, min(layer_idx, len(self._paths) - 1))
-                    layer: ak.Array = self._paths[clamped_layer_idx]
-                    flat_layer: ak.Array = ak.flatten(layer)
-                    clamped_point_idx = max(0, min(point_idx, len(flat_layer) - 1))
-                    clamped: ak.Array = clamp_paths(ak.Array([layer]), clamped_point_idx)
-                    flat_clamped: ak.Array = ak.flatten(clamped)
-
-                    if hasattr(feature_obj, "aLocalPoints"):
-                        feature_obj.aLocalPoints = flat_clamped.to_list()
-                    if hasattr(feature_obj, "bLocalPoint"):
-                        feature_obj.bLocalPoint = flat_clamped.to_list()[-1]
-                    if hasattr(feature_obj, "cGlobalPoint"):
-                        feature_obj.cGlobalPoint = (feature_obj.getGlobalPlacement().Base +
-                                                    App.Vector(flat_clamped.to_list()[-1]))
-
-                    feature_obj.Shape = make_wires(clamped)
-                    App.ActiveDocument.recompute()
+                    clamped_point_idx = max(0, min(point_idx, self._paths.layer_point_count(clamped_layer_idx) - 1))
+                    clamped: Toolpath = clamp_paths(self._paths.layer(clamped_layer_idx), clamped_point_idx)
+                    self.write_results(feature_obj, clamped.points)
+
+                    self.show(feature_obj, clamped, self.display_cache.render(
+                        clamped_layer_idx, int(self._paths.layer_point_offsets[clamped_layer_idx]) + clamped_point_idx
+                    ) if self.builds_shape(feature_obj) else None)
+                    self.recompute.request()
 
         if prop == "bLayerIndex" and self._paths is not None:
             if hasattr(feature_obj, "aMode") and feature_obj.getPropertyByName("aMode") == "Layer":
                 layer_idx: int = feature_obj.getPropertyByName("bLayerIndex")
 
                 clamped_idx = max(0, min(layer_idx, len(self._paths) - 1))
-                layer: ak.Array = self._paths[clamped_idx]
-                flat_layer: ak.Array = ak.flatten(layer)
+                layer: Toolpath = self._paths.layer(clamped_idx)
+                self.write_results(feature_obj, layer.points)
+
+                self.show(feature_obj, layer,
+                          self.display_cache.range_shape(clamped_idx, clamped_idx)
+                          if self.builds_shape(feature_obj) else None)
+                self.recompute.request()
+
+        if prop in ("bLayerIndex", "dLastLayer") and self._paths is not None:
+            if hasattr(feature_obj, "aMode") and feature_obj.getPropertyByName("aMode") == "Range":
+                if hasattr(feature_obj, "dLastLayer"):
+                    first_idx: int = feature_obj.getPropertyByName("bLayerIndex")
+                    last_idx: int = feature_obj.getPropertyByName("dLastLayer")
+
+                    clamped_first_idx = max(0, min(first_idx, len(self._paths) - 1))
+                    clamped_last_idx = max(clamped_first_idx, min(last_idx, len(self._paths) - 1))
+                    layers: Toolpath = self._paths.layers(clamped_first_idx, clamped_last_idx + 1)
+                    self.write_results(feature_obj, layers.points)
+
+                    level: int = self.level_index(feature_obj, clamped_last_idx - clamped_first_idx + 1)
+                    if level > 0:
+                        overview, shape = self.display_cache.level_range(
+                            clamped_first_idx, clamped_last_idx, level, float(feature_obj.bTolerance),
+                            self.builds_shape(feature_obj)
+                        )
+                        self.show(feature_obj, overview, shape)
+                    else:
+                        self.show(feature_obj, layers,
+                                  self.display_cache.range_shape(clamped_first_idx, clamped_last_idx)
+                                  if self.builds_shape(feature_obj) else None)
+                    self.recompute.request()
 
-                if hasattr(feature_obj, "aLocalPoints"):
-                    feature_obj.aLocalPoints = flat_layer.to_list()
-                if hasattr(feature_obj, "bLocalPoint"):
-                    feature_obj.bLocalPoint = flat_layer.to_list()[-1]
-                if hasattr(feature_obj, "cGlobalPoint"):
-                    feature_obj.cGlobalPoint = (feature_obj.getGlobalPlacement().Base +
-                                                App.Vector(flat_layer.to_list()[-1]))
+        if prop in ("aMode", "eTypes") and self._paths is not None:
+            if hasattr(feature_obj, "eTypes") and feature_obj.getPropertyByName("aMode") == "Type":
+                selected: Toolpath = self.selected(feature_obj)
+                if selected.point_count > 0:
+                    self.write_results(feature_obj, selected.points)
 
-                feature_obj.Shape = make_wires(layer)
-                App.ActiveDocument.recompute()
+                self.show(feature_obj, selected, make_wires(selected) if self.builds_shape(feature_obj) else None)
+                self.recompute.request()
+
+        if prop == "aShape" and self.visible is not None:
+            self.show(feature_obj, self.visible, make_wires(self.visible) if self.builds_shape(feature_obj) else None)
+
+        if prop in ("aMesh", "bHeight", "cWidth", "dPerimeters", "ePattern", "fDensity", "gAngle", "hAnchor",
+                    "lArcFitting"):
+            if self._job is not None and self._job.running:
+                self._job.cancel()
+                self._job: Optional[SliceJob] = None
 
         if prop in ("aMesh", "bHeight", "cWidth", "dPerimeters", "ePattern", "fDensity", "gAngle", "hAnchor",
-                    "iAxisOffset", "jDiscretize", "kSeamShifts"):
+                    "iAxisOffset", "jDiscretize", "kSeamShifts", "lArcFitting"):
             if hasattr(feature_obj, "aMode"):
                 feature_obj.aMode = "None"
 
+    # noinspection PyPep8Naming
+    def onDocumentRestored(self, feature_obj: Part.Feature) -> None:
+        view_obj: Optional[Gui.ViewProviderDocumentObject] = getattr(feature_obj, "ViewObject", None)
+        if view_obj is not None and hasattr(view_obj.Proxy, "redraw"):
+            overview: Optional[Toolpath] = self.stored_overview()
+            if overview is None and self._paths is not None:
+                overview: Optional[Toolpath] = self.overview(feature_obj)
+            self._overview: Optional[Toolpath] = overview
+            self._visible: Optional[Toolpath] = overview
+            view_obj.Proxy.redraw(overview)
+
     def dumps(self) -> str:
-        return ak.to_json(self._paths)
+        if getattr(self, "_state", None) is not None:
+            return self._state
+
+        paths: Toolpath = self._paths if self._paths is not None else Toolpath()
+        state: str = STATE_PREFIX + base64.b64encode(paths.to_bytes()).decode("ascii")
+        if paths.point_count > 0 and getattr(self, "_overview", None) is not None:
+            state += STATE_SEPARATOR + base64.b64encode(self._overview.to_bytes()).decode("ascii")
+        return state
 
     def loads(self, state: str) -> None:
+        if state.startswith(STATE_PREFIX):
+            self._state: Optional[str] = state
+            return None
+
         paths_record: ak.Array = ak.from_json(state)
-        self._paths: ak.Array = ak.zip([paths_record["0"], paths_record["1"], paths_record["2"]])
+        if len(paths_record) > 0:
+            self._paths: Optional[Toolpath] = Toolpath.from_awkward(
+                ak.zip([paths_record["0"], paths_record["1"], paths_record["2"]])
+            )
+        else:
+            self._paths: Optional[Toolpath] = None
+        return None
+
+
+class ViewProviderSlicer:
+    def __init__(self, view_obj: Gui.ViewProviderDocumentObject) -> None:
+        view_obj.addProperty("App::PropertyEnumeration", "aColoring", "Toolpath", "Coloring of the paths")
+        view_obj.addProperty("App::PropertyFloat", "bLineWidth", "Toolpath", "Line width of the paths")
+
+        view_obj.aColoring = ["Layer", "Type"]
+        view_obj.bLineWidth = 2.
+
+        view_obj.Proxy = self
+
+    def attach(self, view_obj: Gui.ViewProviderDocumentObject) -> None:
+        self._view_obj: Gui.ViewProviderDocumentObject = view_obj
+
+        self._style: coin.SoDrawStyle = coin.SoDrawStyle()
+        self._binding: coin.SoMaterialBinding = coin.SoMaterialBinding()
+        self._binding.value = coin.SoMaterialBinding.PER_PART
+        self._material: coin.SoMaterial = coin.SoMaterial()
+        self._coordinates: coin.SoCoordinate3 = coin.SoCoordinate3()
+        self._lines: coin.SoLineSet = coin.SoLineSet()
+
+        group: coin.SoSeparator = coin.SoSeparator()
+        for node in (self._style, self._binding, self._material, self._coordinates, self._lines):
+            group.addChild(node)
+        view_obj.addDisplayMode(group, "Toolpath")
+
+    # noinspection PyMethodMayBeStatic
+    def getDisplayModes(self, _view_obj: Gui.ViewProviderDocumentObject) -> list[str]:
+        return ["Toolpath"]
+
+    # noinspection PyMethodMayBeStatic
+    def getDefaultDisplayMode(self) -> str:
+        return "Toolpath"
+
+    # noinspection PyMethodMayBeStatic
+    def setDisplayMode(self, mode: str) -> str:
+        return mode
+
+    def redraw(self, paths: Optional[Toolpath]) -> None:
+        if paths is None or paths.point_count == 0:
+            self._lines.numVertices.setNum(0)
+            self._coordinates.point.setNum(0)
+            self._material.diffuseColor.setNum(0)
+            return
+
+        paths: Toolpath = tessellate(paths)
+
+        keys: np.ndarray = np.repeat(np.arange(paths.layer_count), np.diff(paths.layer_offsets))
+        if self._view_obj.getPropertyByName("aColoring") == "Type" and "type" in paths.attributes:
+            keys: np.ndarray = paths.attributes["type"][paths.path_starts]
+        colors: np.ndarray = path_colors(keys)
+
+        self._style.lineWidth = float(self._view_obj.getPropertyByName("bLineWidth"))
+        self._lines.numVertices.setNum(0)
+        self._coordinates.point.setValues(0, paths.point_count, paths.points.astype(np.float32))
+        self._coordinates.point.setNum(paths.point_count)
+        self._material.diffuseColor.setValues(0, len(colors), colors)
+        self._material.diffuseColor.setNum(len(colors))
+        self._lines.numVertices.setValues(0, paths.path_count, paths.path_lengths.tolist())
+        self._lines.numVertices.setNum(paths.path_count)
+
+    # noinspection PyPep8Naming
+    def updateData(self, feature_obj: Part.Feature, prop: str) -> None:
+        if (prop == "Shape" and hasattr(self, "_lines") and not feature_obj.Document.Restoring and
+                hasattr(feature_obj.Proxy, "visible")):
+            self.redraw(feature_obj.Proxy.visible)
+
+    # noinspection PyPep8Naming
+    def onChanged(self, view_obj: Gui.ViewProviderDocumentObject, prop: str) -> None:
+        if prop in ("aColoring", "bLineWidth") and hasattr(self, "_lines"):
+            feature_obj: Part.Feature = view_obj.Object
+            if hasattr(feature_obj.Proxy, "visible"):
+                self.redraw(feature_obj.Proxy.visible)
+
+    def dumps(self) -> None:
+        return None
+
+    def loads(self, _state: Optional[str]) -> None:
         return None
 
 
 if __name__ == "__main__":
     import slicer  # noqa
     importlib.reload(slicer)
-    from slicer import Slicer  # noqa
+    from slicer import Slicer, ViewProviderSlicer  # noqa
 
     if App.ActiveDocument:
         if len(Gui.Selection.getSelection()) > 0:
@@ -309,7 +840,7 @@ if __name__ == "__main__":
                     Part.Feature, App.ActiveDocument.addObject("Part::FeaturePython", "Slicer")
                 )
                 Slicer(feature_obj=slice_doc_obj, mesh=selection)
-                slice_doc_obj.ViewObject.Proxy = 0
+                ViewProviderSlicer(slice_doc_obj.ViewObject)
             else:
                 print("No mesh selected.")
         else:
@@ -0,0 +1,43 @@
+from __future__ import annotations
+from typing import Callable, cast
+
+import PySide2.QtCore as QtCore
+
+
+RATE: float = 30.
+
+
+class Throttle(QtCore.QObject):
+    def __init__(self, callback: Callable[[], None], rate: float = RATE, parent: QtCore.QObject = None) -> None:
+        super().__init__(parent)
+
+        self._callback: Callable[[], None] = callback
+        self._pending: bool = False
+
+        self._timer: QtCore.QTimer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(max(1, int(1000 / rate)))
+        cast(QtCore.SignalInstance, self._timer.timeout).connect(self.on_timeout)
+
+    @property
+    def pending(self) -> bool:
+        return self._pending
+
+    def request(self) -> None:
+        if self._timer.isActive():
+            self._pending: bool = True
+        else:
+            self._callback()
+            self._timer.start()
+
+    def flush(self) -> None:
+        self._timer.stop()
+        if self._pending:
+            self._pending: bool = False
+            self._callback()
+
+    def on_timeout(self) -> None:
+        if self._pending:
+            self._pending: bool = False
+            self._callback()
+            self._timer.start()
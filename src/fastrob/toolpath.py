@@ -0,0 +1,356 @@
+from __future__ import annotations
+from typing import Optional
+
+import io
+import zlib
+
+import numpy as np
+import awkward as ak
+
+
+def ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    offsets: np.ndarray = np.cumsum(lengths) - lengths
+    return np.arange(int(np.sum(lengths))) - np.repeat(offsets - starts, lengths)
+
+
+def resample(paths: Toolpath, distance: float) -> Toolpath:
+    starts: np.ndarray = paths.path_starts
+    stops: np.ndarray = paths.path_stops
+    keep: np.ndarray = stops - starts > 1
+    starts, stops = starts[keep], stops[keep]
+
+    segment_lengths: np.ndarray = np.linalg.norm(np.diff(paths.points, axis=0), axis=1)
+    segment_lengths[paths.path_offsets[1:-1] - 1] = 0.
+    abscissae: np.ndarray = np.concatenate([[0.], np.cumsum(segment_lengths)])
+
+    lengths: np.ndarray = abscissae[stops - 1] - abscissae[starts]
+    intervals: np.ndarray = np.maximum(np.ceil(lengths / distance - 1e-9), 1).astype(np.int64)
+    counts: np.ndarray = intervals + 1
+    path_ids: np.ndarray = np.repeat(np.arange(len(starts)), counts)
+    steps: np.ndarray = ranges(np.zeros(len(starts), dtype=np.int64), counts)
+
+    targets: np.ndarray = abscissae[starts][path_ids] + lengths[path_ids] * steps / intervals[path_ids]
+    segments: np.ndarray = np.searchsorted(abscissae, targets, side="right") - 1
+    segments: np.ndarray = np.clip(segments, starts[path_ids], stops[path_ids] - 2)
+
+    spans: np.ndarray = abscissae[segments + 1] - abscissae[segments]
+    ratios: np.ndarray = np.divide(targets - abscissae[segments], spans, out=np.zeros_like(spans), where=spans > 0)
+    ratios: np.ndarray = np.clip(ratios, 0., 1.)[:, np.newaxis]
+    points: np.ndarray = paths.points[segments] + ratios * (paths.points[segments + 1] - paths.points[segments])
+
+    path_offsets: np.ndarray = np.concatenate([[0], np.cumsum(counts)])
+    points[path_offsets[1:] - 1] = paths.points[stops - 1]
+
+    layer_offsets: np.ndarray = np.concatenate([[0], np.cumsum(keep)])[paths.layer_offsets]
+    attribute_ids: np.ndarray = np.where(ratios[:, 0] > 0, segments + 1, segments)
+    return Toolpath(points, path_offsets, layer_offsets,
+                    {name: column[attribute_ids] for name, column in paths.attributes.items()})
+
+
+def roll_paths(paths: Toolpath, layer_shifts: np.ndarray, tolerance: float = 1.) -> Toolpath:
+    starts: np.ndarray = paths.path_starts
+    lengths: np.ndarray = paths.path_lengths
+    is_closed: np.ndarray = (lengths > 1) & (
+        np.linalg.norm(paths.points[starts] - paths.points[np.maximum(paths.path_stops - 1, 0)], axis=1) < tolerance
+    )
+
+    path_shifts: np.ndarray = np.where(is_closed, np.repeat(layer_shifts, np.diff(paths.layer_offsets)), 0)
+    ring_lengths: np.ndarray = np.maximum(np.where(is_closed, lengths - 1, lengths), 1)
+
+    local_ids: np.ndarray = np.arange(paths.point_count) - np.repeat(starts, lengths)
+    ring_ids: np.ndarray = np.where(local_ids < np.repeat(ring_lengths, lengths), local_ids, 0)
+    ids: np.ndarray = np.repeat(starts, lengths) + (ring_ids - np.repeat(path_shifts, lengths)) % np.repeat(
+        ring_lengths, lengths
+    )
+
+    is_seam: np.ndarray = (ids == np.repeat(starts, lengths)) & (local_ids > 0) & np.repeat(is_closed, lengths)
+    attribute_ids: np.ndarray = np.where(is_seam, np.repeat(paths.path_stops - 1, lengths), ids)
+    rolled: Toolpath = paths.gather(ids, paths.path_offsets, attribute_ids=attribute_ids)
+    if "arc_via" in rolled.attributes:
+        rolled.attributes["arc_via"][rolled.path_starts] = np.nan
+    return rolled
+
+
+def offset_ends(paths: Toolpath, offset: np.ndarray) -> Toolpath:
+    lengths: np.ndarray = paths.path_lengths + 2
+    path_offsets: np.ndarray = np.concatenate([[0], np.cumsum(lengths)])
+    firsts: np.ndarray = path_offsets[:-1]
+    lasts: np.ndarray = path_offsets[1:] - 1
+
+    ids: np.ndarray = ranges(paths.path_starts - 1, lengths)
+    ids[firsts] += 1
+    ids[lasts] -= 1
+
+    result: Toolpath = paths.gather(ids, path_offsets)
+    result.points[firsts] += offset
+    result.points[lasts] += offset
+    if "arc_via" in result.attributes:
+        result.attributes["arc_via"][np.concatenate([firsts, firsts + 1, lasts])] = np.nan
+    return result
+
+
+def tessellate(paths: Toolpath, segment_length: float = 1.) -> Toolpath:
+    vias: Optional[np.ndarray] = paths.attributes.get("arc_via")
+    if vias is None:
+        return paths
+
+    is_arc: np.ndarray = ~np.isnan(vias[:, 0])
+    is_arc[paths.path_starts] = False
+    ends: np.ndarray = np.flatnonzero(is_arc)
+
+    a: np.ndarray = paths.points[ends - 1]
+    b: np.ndarray = vias[ends]
+    c: np.ndarray = paths.points[ends]
+    a_sq, b_sq, c_sq = (np.einsum("ij,ij->i", p[:, :2], p[:, :2]) for p in (a, b, c))
+
+    d: np.ndarray = 2 * (a[:, 0] * (b[:, 1] - c[:, 1]) + b[:, 0] * (c[:, 1] - a[:, 1]) + c[:, 0] * (a[:, 1] - b[:, 1]))
+    is_valid: np.ndarray = np.abs(d) > 1e-12
+    d: np.ndarray = np.where(is_valid, d, 1.)
+    center_x: np.ndarray = (a_sq * (b[:, 1] - c[:, 1]) + b_sq * (c[:, 1] - a[:, 1]) + c_sq * (a[:, 1] - b[:, 1])) / d
+    center_y: np.ndarray = (a_sq * (c[:, 0] - b[:, 0]) + b_sq * (a[:, 0] - c[:, 0]) + c_sq * (b[:, 0] - a[:, 0])) / d
+
+    radii: np.ndarray = np.hypot(a[:, 0] - center_x, a[:, 1] - center_y)
+    first_angles: np.ndarray = np.arctan2(a[:, 1] - center_y, a[:, 0] - center_x)
+    deltas: np.ndarray = (np.arctan2(c[:, 1] - center_y, c[:, 0] - center_x) - first_angles) % (2 * np.pi)
+    sweeps: np.ndarray = np.where(d > 0, deltas, deltas - 2 * np.pi)
+
+    counts: np.ndarray = np.ones(paths.point_count, dtype=np.int64)
+    counts[ends] = np.where(is_valid, np.maximum(np.ceil(np.abs(sweeps) * radii / segment_length), 1), 1)
+    rows: np.ndarray = np.repeat(np.arange(paths.point_count), counts)
+    steps: np.ndarray = ranges(np.ones(paths.point_count, dtype=np.int64), counts)
+
+    arc_rows: np.ndarray = np.flatnonzero(is_arc[rows] & (steps < counts[rows]))
+    arcs: np.ndarray = np.searchsorted(ends, rows[arc_rows])
+    fractions: np.ndarray = steps[arc_rows] / counts[rows[arc_rows]]
+    angles: np.ndarray = first_angles[arcs] + sweeps[arcs] * fractions
+
+    points: np.ndarray = paths.points[rows]
+    points[arc_rows] = np.column_stack([center_x[arcs] + radii[arcs] * np.cos(angles),
+                                        center_y[arcs] + radii[arcs] * np.sin(angles),
+                                        a[arcs, 2] + (c[arcs, 2] - a[arcs, 2]) * fractions])
+
+    path_offsets: np.ndarray = np.concatenate([[0], np.cumsum(np.add.reduceat(counts, paths.path_starts))])
+    return Toolpath(points, path_offsets, paths.layer_offsets,
+                    {name: column[rows] for name, column in paths.attributes.items() if name != "arc_via"})
+
+
+def simplify(paths: Toolpath, tolerance: float, fixed: Optional[np.ndarray] = None) -> Toolpath:
+    keep: np.ndarray = np.zeros(paths.point_count, dtype=bool) if fixed is None else fixed.copy()
+    keep[paths.path_starts] = True
+    keep[paths.path_stops - 1] = True
+
+    kept: np.ndarray = np.flatnonzero(keep)
+    firsts, lasts = kept[:-1], kept[1:]
+    firsts, lasts = firsts[lasts - firsts > 1], lasts[lasts - firsts > 1]
+
+    while len(firsts) > 0:
+        interior: np.ndarray = lasts - firsts - 1
+        owners: np.ndarray = np.repeat(np.arange(len(firsts)), interior)
+        ids: np.ndarray = ranges(firsts + 1, interior)
+
+        a: np.ndarray = paths.points[firsts][owners]
+        ab: np.ndarray = paths.points[lasts][owners] - a
+        ap: np.ndarray = paths.points[ids] - a
+        squared: np.ndarray = np.einsum("ij,ij->i", ab, ab)
+        ratios: np.ndarray = np.divide(np.einsum("ij,ij->i", ap, ab), squared, out=np.zeros_like(squared),
+                                       where=squared > 0)
+        distances: np.ndarray = np.linalg.norm(ap - np.clip(ratios, 0., 1.)[:, np.newaxis] * ab, axis=1)
+
+        maxima: np.ndarray = np.maximum.reduceat(distances, np.cumsum(interior) - interior)
+        candidates: np.ndarray = np.flatnonzero(distances == maxima[owners])
+        pivots: np.ndarray = ids[candidates[np.unique(owners[candidates], return_index=True)[1]]]
+
+        split: np.ndarray = maxima > tolerance
+        keep[pivots[split]] = True
+
+        firsts: np.ndarray = np.concatenate([firsts[split], pivots[split]])
+        lasts: np.ndarray = np.concatenate([pivots[split], lasts[split]])
+        firsts, lasts = firsts[lasts - firsts > 1], lasts[lasts - firsts > 1]
+
+    ids: np.ndarray = np.flatnonzero(keep)
+    counts: np.ndarray = np.add.reduceat(keep, paths.path_starts) if paths.path_count > 0 else np.zeros(0)
+    return paths.gather(ids, np.concatenate([[0], np.cumsum(counts)]))
+
+
+def concatenate(parts: list[Toolpath]) -> Toolpath:
+    if not parts:
+        return Toolpath()
+
+    point_counts: np.ndarray = np.cumsum([0] + [part.point_count for part in parts])
+    path_counts: np.ndarray = np.cumsum([0] + [part.path_count for part in parts])
+    names: set[str] = set.intersection(*(set(part.attributes) for part in parts))
+    return Toolpath(np.concatenate([part.points for part in parts]),
+                    np.concatenate([[0]] + [part.path_offsets[1:] + offset
+                                            for part, offset in zip(parts, point_counts)]),
+                    np.concatenate([[0]] + [part.layer_offsets[1:] + offset
+                                            for part, offset in zip(parts, path_counts)]),
+                    {name: np.concatenate([part.attributes[name] for part in parts]) for name in names})
+
+
+class DetailPyramid:
+    def __init__(self, paths: Toolpath, tolerance: float, levels: int = 6) -> None:
+        self.paths: Toolpath = paths
+        self.tolerance: float = tolerance
+        self._levels: list[Optional[Toolpath]] = [None] * (levels + 1)
+
+    def level(self, idx: int) -> Toolpath:
+        idx: int = max(0, min(idx, len(self._levels) - 1))
+        if self._levels[idx] is None:
+            self._levels[idx] = (tessellate(self.paths) if idx == 0 else
+                                 simplify(self.level(idx - 1), self.tolerance * 2 ** (idx - 1)))
+        return self._levels[idx]
+
+    def level_index(self, visible_layers: int, detail_layers: int) -> int:
+        if self.tolerance <= 0 or visible_layers <= detail_layers:
+            return 0
+        return min(int(np.ceil(np.log2(visible_layers / max(detail_layers, 1)))), len(self._levels) - 1)
+
+    def select(self, visible_layers: int, detail_layers: int) -> Toolpath:
+        return self.level(self.level_index(visible_layers, detail_layers))
+
+
+class Toolpath:
+    __slots__ = ("points", "path_offsets", "layer_offsets", "layer_point_offsets", "attributes")
+
+    def __init__(self, points: Optional[np.ndarray] = None, path_offsets: Optional[np.ndarray] = None,
+                 layer_offsets: Optional[np.ndarray] = None,
+                 attributes: Optional[dict[str, np.ndarray]] = None) -> None:
+        self.points: np.ndarray = np.ascontiguousarray(
+            points if points is not None else np.empty((0, 3)), dtype=np.float64
+        ).reshape(-1, 3)
+        self.path_offsets: np.ndarray = np.asarray(
+            path_offsets if path_offsets is not None else [0, len(self.points)] if len(self.points) else [0],
+            dtype=np.int64
+        )
+        self.layer_offsets: np.ndarray = np.asarray(
+            layer_offsets if layer_offsets is not None else [0, self.path_count] if self.path_count else [0],
+            dtype=np.int64
+        )
+        self.layer_point_offsets: np.ndarray = self.path_offsets[self.layer_offsets]
+        self.attributes: dict[str, np.ndarray] = attributes if attributes is not None else {}
+
+    @classmethod
+    def from_awkward(cls, paths: ak.Array) -> Toolpath:
+        if paths.layout.minmax_depth != (3, 3) or len(paths) == 0:
+            return cls()
+
+        path_lengths: np.ndarray = ak.to_numpy(ak.num(ak.flatten(paths, axis=1), axis=1))
+        layer_lengths: np.ndarray = ak.to_numpy(ak.num(paths, axis=1))
+        points: np.ndarray = np.column_stack([ak.to_numpy(ak.flatten(coordinates, axis=None))
+                                              for coordinates in ak.unzip(paths)])
+
+        return cls(points, np.concatenate([[0], np.cumsum(path_lengths)]),
+                   np.concatenate([[0], np.cumsum(layer_lengths)]))
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        arrays: dict[str, np.ndarray] = {
+            "points": self.points, "path_offsets": self.path_offsets, "layer_offsets": self.layer_offsets
+        }
+        arrays.update({"attribute_" + name: column for name, column in self.attributes.items()})
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: dict[str, np.ndarray]) -> Toolpath:
+        attributes: dict[str, np.ndarray] = {name[len("attribute_"):]: column for name, column in arrays.items()
+                                             if name.startswith("attribute_")}
+        return cls(arrays["points"], arrays["path_offsets"], arrays["layer_offsets"], attributes)
+
+    def to_bytes(self, level: int = 6) -> bytes:
+        buffer: io.BytesIO = io.BytesIO()
+        np.savez(buffer, **self.to_arrays())
+        return zlib.compress(buffer.getvalue(), level)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> Toolpath:
+        with np.load(io.BytesIO(zlib.decompress(data))) as arrays:
+            return cls.from_arrays({name: arrays[name] for name in arrays.files})
+
+    @property
+    def layer_count(self) -> int:
+        return len(self.layer_offsets) - 1
+
+    @property
+    def path_count(self) -> int:
+        return len(self.path_offsets) - 1
+
+    @property
+    def point_count(self) -> int:
+        return int(self.path_offsets[-1])
+
+    @property
+    def path_lengths(self) -> np.ndarray:
+        return np.diff(self.path_offsets)
+
+    @property
+    def path_starts(self) -> np.ndarray:
+        return self.path_offsets[:-1]
+
+    @property
+    def path_stops(self) -> np.ndarray:
+        return self.path_offsets[1:]
+
+    def __len__(self) -> int:
+        return self.layer_count
+
+    def view(self, first_path: int, last_path: int, layer_offsets: np.ndarray,
+             point_count: Optional[int] = None) -> Toolpath:
+        path_offsets: np.ndarray = self.path_offsets[first_path:last_path + 1]
+        start: int = int(path_offsets[0])
+        stop: int = int(path_offsets[-1]) if point_count is None else start + point_count
+
+        if point_count is not None:
+            path_offsets: np.ndarray = np.append(path_offsets[:-1], stop)
+
+        return Toolpath(self.points[start:stop], path_offsets - start, layer_offsets,
+                        {name: column[start:stop] for name, column in self.attributes.items()})
+
+    def layers(self, first: int, last: int) -> Toolpath:
+        first: int = max(0, min(first, self.layer_count))
+        last: int = max(first, min(last, self.layer_count))
+        layer_offsets: np.ndarray = self.layer_offsets[first:last + 1]
+        return self.view(int(layer_offsets[0]), int(layer_offsets[-1]), layer_offsets - layer_offsets[0])
+
+    def layer(self, idx: int) -> Toolpath:
+        return self.layers(idx, idx + 1)
+
+    def path(self, idx: int) -> np.ndarray:
+        return self.points[self.path_offsets[idx]:self.path_offsets[idx + 1]]
+
+    def locate(self, idx: int) -> tuple[int, int, int]:
+        idx: int = max(0, min(idx, self.point_count - 1))
+        path_idx: int = int(np.searchsorted(self.path_offsets, idx, side="right")) - 1
+        layer_idx: int = int(np.searchsorted(self.layer_offsets, path_idx, side="right")) - 1
+        return layer_idx, path_idx, idx - int(self.path_offsets[path_idx])
+
+    def layer_point_count(self, idx: int) -> int:
+        return int(self.layer_point_offsets[idx + 1] - self.layer_point_offsets[idx])
+
+    def prefix(self, count: int) -> Toolpath:
+        count: int = max(0, min(count, self.point_count))
+        if count == 0:
+            return self.view(0, 0, np.zeros(1, dtype=np.int64), 0)
+
+        layer_idx, path_idx, _ = self.locate(count - 1)
+        layer_offsets: np.ndarray = np.append(self.layer_offsets[:layer_idx + 1], path_idx + 1)
+        return self.view(0, path_idx + 1, layer_offsets, count)
+
+    def path_index(self, name: str) -> dict[int, np.ndarray]:
+        if name not in self.attributes or self.path_count == 0:
+            return {}
+
+        keys: np.ndarray = self.attributes[name][self.path_starts]
+        order: np.ndarray = np.argsort(keys, kind="stable")
+        values, firsts = np.unique(keys[order], return_index=True)
+        return dict(zip(values.tolist(), np.split(order, firsts[1:])))
+
+    def select(self, path_ids: np.ndarray) -> Toolpath:
+        lengths: np.ndarray = self.path_lengths[path_ids]
+        return self.gather(ranges(self.path_starts[path_ids], lengths), np.concatenate([[0], np.cumsum(lengths)]),
+                           np.searchsorted(path_ids, self.layer_offsets))
+
+    def gather(self, ids: np.ndarray, path_offsets: np.ndarray, layer_offsets: Optional[np.ndarray] = None,
+               attribute_ids: Optional[np.ndarray] = None) -> Toolpath:
+        attribute_ids: np.ndarray = attribute_ids if attribute_ids is not None else ids
+        return Toolpath(self.points[ids], path_offsets,
+                        layer_offsets if layer_offsets is not None else self.layer_offsets,
+                        {name: column[attribute_ids] for name, column in self.attributes.items()})
@@ -1,5 +1,5 @@
 from typing import Optional, Iterator
-import subprocess
+import hashlib
 
 import numpy as np
 import awkward as ak
@@ -10,46 +10,68 @@ from ikpy.link import OriginLink, URDFLink
 import FreeCAD as App
 import Part
 import Points
+import Mesh
 
 from gcodeparser import GcodeParser, GcodeLine
 
+from gcode import tokenize_layers, assemble
+from toolpath import Toolpath, resample, roll_paths, offset_ends, tessellate
 
-def slice_stl(file: str, layer_height: float, seam_width: float, perimeters: int, fill_pattern: str, fill_density: int,
-              infill_angle: float, infill_anchor_max: float) -> subprocess.CompletedProcess:
-    cmd: str = (
-            "prusa-slicer-console.exe "
 
-            # [ ACTIONS ]
-            "--export-gcode " +
+def slice_command(file: str, layer_height: float, seam_width: float, perimeters: int, fill_pattern: str,
+                  fill_density: int, infill_angle: float, infill_anchor_max: float,
+                  arc_fitting: bool = False) -> list[str]:
+    return [
+        "prusa-slicer-console.exe",
 
-            # [ TRANSFORM ]
-            "--dont-arrange " +
+        # [ ACTIONS ]
+        "--export-gcode",
 
-            # [ OPTIONS ]
-            "--nozzle-diameter " + str(seam_width) + " " +
-            "--first-layer-height " + str(layer_height) + " " +
-            "--layer-height " + str(layer_height) + " " +
-            "--first-layer-extrusion-width " + str(seam_width) + " " +
-            "--extrusion-width " + str(seam_width) + " " +
-            "--solid-layers 0 " +
-            "--perimeters " + str(perimeters) + " " +
-            "--fill-pattern " + str(fill_pattern) + " " +
-            "--infill-overlap 50% " +
-            "--fill-density " + str(fill_density) + "% " +
-            "--fill-angle " + str(infill_angle) + " " +
-            "--infill-anchor-max " + str(infill_anchor_max) + " " +
-            "--skirts 0 " +
-            "--filament-retract-length 0 " +
-            "--seam-position rear " +
+        # [ TRANSFORM ]
+        "--dont-arrange",
 
-            # [ file.stl ... ]
-            file
-    )
+        # [ OPTIONS ]
+        "--nozzle-diameter", str(seam_width),
+        "--first-layer-height", str(layer_height),
+        "--layer-height", str(layer_height),
+        "--first-layer-extrusion-width", str(seam_width),
+        "--extrusion-width", str(seam_width),
+        "--solid-layers", "0",
+        "--perimeters", str(perimeters),
+        "--fill-pattern", str(fill_pattern),
+        "--infill-overlap", "50%",
+        "--fill-density", str(fill_density) + "%",
+        "--fill-angle", str(infill_angle),
+        "--infill-anchor-max", str(infill_anchor_max),
+        "--skirts", "0",
+        "--filament-retract-length", "0",
+        "--seam-position", "rear",
+        *(["--arc-fitting", "emit_center"] if arc_fitting else []),
 
-    return subprocess.run(args=cmd, shell=True, capture_output=True, text=True)
+        # [ file.stl ... ]
+        file
+    ]
 
 
-def parse_g_code(file: str) -> ak.Array:
+def slice_key(mesh: Mesh.Feature, *args: float | int | str) -> str:
+    points, facets = mesh.Mesh.Topology
+
+    digest: hashlib.sha256 = hashlib.sha256()
+    digest.update(np.array(points, dtype=np.float64).tobytes())
+    digest.update(np.array(facets, dtype=np.int64).tobytes())
+    digest.update(np.array(mesh.Placement.Matrix.A, dtype=np.float64).tobytes())
+    digest.update(repr(args).encode())
+    return digest.hexdigest()
+
+
+def g_code_paths(table: np.ndarray) -> Toolpath:
+    return Toolpath(*assemble(table))
+
+
+def parse_g_code(file: str, vectorized: bool = True, processes: Optional[int] = None) -> Toolpath:
+    if vectorized:
+        return g_code_paths(tokenize_layers(file, processes))
+
     result: list[list[list[tuple[float]]]] = []
 
     with open(file, "r") as f:
@@ -98,108 +120,72 @@ def parse_g_code(file: str) -> ak.Array:
         if len(layer) > 0:
             result.append(layer.copy())
 
-    return ak.Array(result)
+    return Toolpath.from_awkward(ak.Array(result))
 
 
-def discretize_paths(paths: ak.Array, distance: int = 2) -> ak.Array:
-    if paths.layout.minmax_depth == (3, 3) and distance != 0:
-        result: list[list[list[App.Vector]]] = []
+def vectors(points: np.ndarray) -> list[App.Vector]:
+    points_kernel: Points.Points = Points.Points()
+    points_kernel.addPoints(points.tolist())
+    return points_kernel.Points
 
-        for layer in paths.to_list():
-            new_layer: list[list[App.Vector]] = []
-            for path in layer:
-                if len(path) > 1:
-                    points_kernel: Points.Points = Points.Points()
-                    points_kernel.addPoints(path)
-                    new_layer.append(Part.makePolygon(path).discretize(Distance=distance))
-            result.append(new_layer)
 
-        result: ak.Array = ak.Array(result)
-        return ak.zip([result[..., 0], result[..., 1], result[..., 2]])
+def discretize_paths(paths: Toolpath, distance: int = 2) -> Toolpath:
+    if paths.point_count > 0 and distance != 0:
+        return resample(tessellate(paths), distance)
 
     else:
         return paths
 
 
-def shift_paths(paths: ak.Array, shift: list[int]) -> ak.Array:
-    if paths.layout.minmax_depth == (3, 3) and len(shift) != 0:
-        shift.extend([shift[-1]] * len(paths))
-        result: list[list[list[App.Vector]]] = []
-
-        for idx, layer in enumerate(paths.to_list()):
-            new_layer: list[list[App.Vector]] = []
-            for path in layer:
-                dist: float = np.linalg.norm(np.array(path[0]) - np.array(path[-1]))
-                if len(path) > 1:
-                    if dist < 1:
-                        new_path: list[App.Vector] = path[:-1]
-                        new_path: list[App.Vector] = new_path[-shift[idx]:] + path[:-shift[idx]]
-                        new_path.append(new_path[0])
-                        new_layer.append(new_path)
-                    else:
-                        new_layer.append(path)
-
-            result.append(new_layer)
-        return ak.Array(result)
+def shift_paths(paths: Toolpath, shift: list[int]) -> Toolpath:
+    if paths.point_count > 0 and len(shift) != 0:
+        layer_shifts: np.ndarray = np.full(len(paths), shift[-1], dtype=np.int64)
+        layer_shifts[:min(len(shift), len(paths))] = shift[:len(paths)]
+        return roll_paths(paths, layer_shifts)
 
     else:
         return paths
 
 
-def axis_offset(paths: ak.Array, offset: App.Vector) -> ak.Array:
-    if paths.layout.minmax_depth == (3, 3) and offset != App.Vector(0, 0, 0):
-        first_items: ak.Array = ak.unflatten(ak.firsts(paths, axis=-1), counts=1, axis=-1)
-        first_x = first_items["0"] + offset.x
-        first_y = first_items["1"] + offset.y
-        first_z = first_items["2"] + offset.z
-        first_items: ak.Array = ak.zip([first_x, first_y, first_z])
-
-        last_indexes: ak.Array = ak.unflatten(ak.num(paths, axis=-1) - 1, counts=1, axis=-1)
-        last_items: ak.Array = paths[last_indexes]
-        last_x = last_items["0"] + offset.x
-        last_y = last_items["1"] + offset.y
-        last_z = last_items["2"] + offset.z
-        last_items: ak.Array = ak.zip([last_x, last_y, last_z])
-        return ak.concatenate([first_items, paths, last_items], axis=-1)
+def axis_offset(paths: Toolpath, offset: App.Vector) -> Toolpath:
+    if paths.point_count > 0 and offset != App.Vector(0, 0, 0):
+        return offset_ends(paths, np.array(tuple(offset)))
 
     else:
         return paths
 
 
-def clamp_paths(paths: ak.Array, idx: int) -> ak.Array:
-    if paths.layout.minmax_depth == (3, 3):
-        simplified: ak.Array = ak.flatten(paths)
-        lengths: ak.Array = ak.num(simplified)
-        accumulated_lengths: np.ndarray = np.add.accumulate(lengths.to_list())
-        completed: ak.Array = simplified[idx + 1 > accumulated_lengths]
+def clamp_paths(paths: Toolpath, idx: int) -> Toolpath:
+    return paths.prefix(idx + 1)
 
-        started_ids: np.ndarray = np.where(idx + 1 <= accumulated_lengths)
-        first_started_id: Optional[int] = started_ids[0][0] if len(started_ids[0]) > 0 else None
 
-        result: ak.Array = completed
-        if first_started_id is not None:
-            idx_offset: int = sum(lengths[:first_started_id])
-            result: ak.Array = ak.concatenate([result, [simplified[first_started_id][:(idx + 1 - idx_offset)]]])
-
-        return result
+def make_wires(paths: Toolpath) -> Part.Shape:
+    paths: Toolpath = tessellate(paths)
+    if paths.point_count > 1:
+        points: list[App.Vector] = vectors(paths.points)
+        shape: Part.Shape = Part.makeCompound([Part.makePolygon(points[start:stop])
+                                               for start, stop in zip(paths.path_starts, paths.path_stops)
+                                               if stop - start > 1])
+        return shape if len(shape.Vertexes) > 1 else Part.Shape()
 
     else:
-        return paths
+        return Part.Shape()
 
 
-def make_wires(simple_path: ak.Array) -> Part.Shape:
-    if simple_path.layout.minmax_depth == (2, 2):
-        vectors: list[list[App.Vector]] = []
-        for path in simple_path.to_list():
-            points_kernel: Points.Points = Points.Points()
-            points_kernel.addPoints(path)
-            vectors.append(points_kernel.Points)
+def path_colors(keys: np.ndarray, saturation: float = .7, value: float = .95) -> np.ndarray:
+    hues: np.ndarray = (keys * 0.618033988749895) % 1. * 6.
+    sectors: np.ndarray = hues.astype(np.int64) % 6
+    fractions: np.ndarray = hues - np.floor(hues)
 
-        shape: Part.Shape = Part.makeCompound([Part.makePolygon(path) for path in vectors if len(path) > 1])
-        return shape if len(shape.Vertexes) > 1 else Part.Shape()
+    p: np.ndarray = np.full(len(keys), value * (1. - saturation))
+    q: np.ndarray = value * (1. - saturation * fractions)
+    t: np.ndarray = value * (1. - saturation * (1. - fractions))
+    v: np.ndarray = np.full(len(keys), value)
 
-    else:
-        return Part.Shape()
+    channels: np.ndarray = np.stack([
+        np.stack([v, q, p, p, t, v]), np.stack([t, v, v, q, p, p]), np.stack([p, p, t, v, v, q])
+    ])
+    return np.ascontiguousarray(channels[:, sectors, np.arange(len(keys))].T, dtype=np.float32)
 
 
 def kinematic_chain(axis_parts: list[App.Part]) -> Optional[Chain]:
@@ -237,33 +223,3 @@ def kinematic_part_iterator(kinematic_part: App.Part) -> Iterator:
     if hasattr(kinematic_part, "Group") and len(kinematic_part.getPropertyByName("Group")) > 0:
         for next_item in kinematic_part_iterator(kinematic_part.Group[0]):
             yield next_item
-
-
-def linear_move(machine: str, pos: tuple[float, float, float]) -> str:
-    if machine == "KUKA":
-        cmd: str = ("LIN {E6POS: X " + str(round(pos[0], 1)) + ", Y " + str(round(pos[1], 1)) + ", Z " +
-                    str(round(pos[2], 1)))
-        cmd += ", A 0, B 90, C 0} C_DIS"
-
-    elif machine == "ABB":
-        cmd: str = ""
-
-    else:
-        cmd: str = ""
-
-    return cmd
-
-
-def point_move(machine: str, pos: tuple[float, float, float]) -> str:
-    if machine == "KUKA":
-        cmd: str = ("PTP {E6POS: X " + str(round(pos[0], 1)) + ", Y " + str(round(pos[1], 1)) + ", Z " +
-                    str(round(pos[2], 1)))
-        cmd += ", A 0, B 90, C 0}"
-
-    elif machine == "ABB":
-        cmd: str = ""
-
-    else:
-        cmd: str = ""
-
-    return cmd
@@ -0,0 +1,27 @@
+import os
+
+import numpy as np
+
+from cache import SliceCache
+from toolpath import Toolpath
+
+
+def test_get_evicts_corrupt_entry(tmp_path) -> None:
+    cache: SliceCache = SliceCache(str(tmp_path))
+    cache.put("key", Toolpath(np.zeros((2, 3)), [0, 2], [0, 1]))
+    with open(cache.entry("key"), "wb") as f:
+        f.write(b"not a zip file")
+
+    assert cache.get("key") is None
+    assert not os.path.exists(cache.entry("key"))
+    assert cache.stats["misses"] == 1
+
+
+def test_stats_resets_corrupt_file(tmp_path) -> None:
+    cache: SliceCache = SliceCache(str(tmp_path))
+    with open(os.path.join(str(tmp_path), "stats.json"), "w") as f:
+        f.write("{\"hits\": 1")
+
+    assert cache.stats == {"hits": 0, "misses": 0, "evictions": 0}
+    cache.record("hits")
+    assert cache.stats["hits"] == 1
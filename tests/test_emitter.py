@@ -0,0 +1,44 @@
+import os
+
+import numpy as np
+import pytest
+
+from emitter import write_program
+from toolpath import Toolpath
+
+
+def sample_paths() -> Toolpath:
+    points: np.ndarray = np.column_stack([np.arange(6.), np.zeros(6), np.full(6, .2)])
+    return Toolpath(points, [0, 3, 6], [0, 2], {"feed": np.array([1800., 1800., 1800., 3000., 3000., 3000.])})
+
+
+def program(tmp_path, output: str, velocity: float) -> str:
+    file: str = os.path.join(str(tmp_path), "test.src")
+    write_program(file, "test", sample_paths(), "KUKA", [], [], False, output, velocity)
+    with open(file, "r") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("output", ["Moves", "Arrays", "Spline"])
+def test_fixed_velocity_is_emitted(tmp_path, output: str) -> None:
+    text: str = program(tmp_path, output, .05)
+
+    if output == "Spline":
+        assert "SPLINE WITH $VEL.CP = 0.050" in text
+    else:
+        assert text.count("$VEL.CP = 0.050") == 1
+        assert text.index("$VEL.CP = 0.050") < text.index("PTP ")
+    assert "0.030" not in text
+
+
+@pytest.mark.parametrize("output", ["Moves", "Arrays", "Spline"])
+def test_velocity_follows_feed(tmp_path, output: str) -> None:
+    text: str = program(tmp_path, output, 0.)
+
+    if output == "Arrays":
+        assert "$VEL.CP = VELOCITIES[POINT_IDX]" in text
+        with open(os.path.join(str(tmp_path), "test.dat"), "r") as f:
+            data: str = f.read()
+        assert "VELOCITIES[1]=0.030" in data and "VELOCITIES[6]=0.050" in data
+    else:
+        assert "0.030" in text and "0.050" in text
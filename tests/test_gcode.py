@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+import pytest
+
+from gcode import tokenize, assemble, E
+from toolpath import Toolpath, tessellate
+
+
+RESOURCES: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "fastrob", "resources")
+
+
+def parse(data: bytes) -> Toolpath:
+    return Toolpath(*assemble(tokenize(data)))
+
+
+@pytest.mark.parametrize("name", ["cuboid.gcode", "pipe.gcode"])
+def test_vectorized_parser_matches_legacy(name: str) -> None:
+    pytest.importorskip("FreeCAD")
+    pytest.importorskip("ikpy")
+    pytest.importorskip("gcodeparser")
+    from utils import parse_g_code
+
+    file: str = os.path.join(RESOURCES, name)
+    vectorized: Toolpath = parse_g_code(file, processes=1)
+    legacy: Toolpath = parse_g_code(file, vectorized=False)
+
+    np.testing.assert_allclose(vectorized.points, legacy.points)
+    np.testing.assert_array_equal(vectorized.path_offsets, legacy.path_offsets)
+    np.testing.assert_array_equal(vectorized.layer_offsets, legacy.layer_offsets)
+
+
+def test_exponent_numbers() -> None:
+    table: np.ndarray = tokenize(b"G1 X1 E1.5e-3\nG1 X2 E-2E2\nG1 X3 E.25e+1\nG1 X4 E-0.5\n")
+    np.testing.assert_allclose(table[E], [1.5e-3, -200., 2.5, -.5])
+
+
+def test_full_circle_after_travel_keeps_midpoint() -> None:
+    paths: Toolpath = parse(b"G1 Z0.2\nG1 X20 Y0\nG3 X20 Y0 I-10 J0 E1\nG1 X0 Y-5 E2\n")
+
+    np.testing.assert_allclose(paths.points[:, :2], [[20, 0], [0, 0], [20, 0], [0, -5]], atol=1e-9)
+    vias: np.ndarray = paths.attributes["arc_via"]
+    np.testing.assert_allclose(vias[1:3, :2], [[10, 10], [10, -10]], atol=1e-9)
+
+    tessellated: Toolpath = tessellate(paths, 1.)
+    radii: np.ndarray = np.linalg.norm(tessellated.points[:-1, :2] - [10, 0], axis=1)
+    np.testing.assert_allclose(radii, 10, atol=1e-9)
+    assert tessellated.point_count > 40
+
+
+def test_arc_after_extrusion_keeps_midpoint() -> None:
+    paths: Toolpath = parse(b"G1 Z0.2\nG1 X0 Y0\nG1 X20 Y0 E1\nG3 X20 Y0 I-10 J0 E2\n")
+
+    np.testing.assert_allclose(paths.points[:, :2], [[0, 0], [20, 0], [0, 0], [20, 0]], atol=1e-9)
+    assert np.isnan(paths.attributes["arc_via"][1, 0])
+    assert not np.any(np.isnan(paths.attributes["arc_via"][2:]))
@@ -0,0 +1,62 @@
+import numpy as np
+
+from gcode import tokenize, assemble
+from toolpath import Toolpath, DetailPyramid, concatenate, offset_ends, roll_paths, tessellate
+
+
+ARC_PATH: bytes = b"""G1 Z0.2
+G1 X10 Y0
+G1 X20 Y0 E1
+G3 X30 Y10 I0 J10 E2
+G1 X30 Y20 E3
+G3 X20 Y30 I-10 J0 E4
+"""
+
+
+def arc_paths() -> Toolpath:
+    paths: Toolpath = Toolpath(*assemble(tokenize(ARC_PATH)))
+    assert "arc_via" in paths.attributes
+    return paths
+
+
+def test_offset_ends_keeps_approach_and_retract_straight() -> None:
+    paths: Toolpath = arc_paths()
+    offset: np.ndarray = np.array([5., 0., 10.])
+    result: Toolpath = offset_ends(paths, offset)
+
+    vias: np.ndarray = result.attributes["arc_via"]
+    assert np.all(np.isnan(vias[[0, 1, result.point_count - 1]]))
+
+    tessellated: Toolpath = tessellate(result, 1.)
+    np.testing.assert_allclose(tessellated.points[0], paths.points[0] + offset)
+    np.testing.assert_allclose(tessellated.points[1], paths.points[0])
+    np.testing.assert_allclose(tessellated.points[-2], paths.points[-1])
+    np.testing.assert_allclose(tessellated.points[-1], paths.points[-1] + offset)
+    assert tessellated.point_count == tessellate(paths, 1.).point_count + 2
+
+
+def test_roll_paths_clears_via_of_new_start() -> None:
+    paths: Toolpath = arc_paths()
+    closed: Toolpath = Toolpath(np.vstack([paths.points, paths.points[:1]]), [0, paths.point_count + 1], [0, 1],
+                                {"arc_via": np.vstack([paths.attributes["arc_via"], np.full((1, 3), np.nan)])})
+
+    rolled: Toolpath = roll_paths(closed, np.array([3]))
+    np.testing.assert_allclose(rolled.points[0], closed.points[2])
+    assert not np.isnan(closed.attributes["arc_via"][2, 0])
+    assert np.all(np.isnan(rolled.attributes["arc_via"][rolled.path_starts]))
+
+
+def test_concatenated_layer_levels_match_pyramid_level() -> None:
+    angles: np.ndarray = np.linspace(0, 2 * np.pi, 200)
+    points: np.ndarray = np.concatenate([
+        np.column_stack([np.cos(angles) * (layer + 5), np.sin(angles), np.full(200, layer)])
+        for layer in range(6) for _ in range(2)
+    ])
+    paths: Toolpath = Toolpath(points, np.arange(0, 2401, 200), np.arange(0, 13, 2), {"feed": np.arange(2400.)})
+
+    level: Toolpath = DetailPyramid(paths, .05).level(3)
+    joined: Toolpath = concatenate([DetailPyramid(paths.layer(idx), .05).level(3) for idx in range(6)])
+    np.testing.assert_array_equal(joined.points, level.points)
+    np.testing.assert_array_equal(joined.path_offsets, level.path_offsets)
+    np.testing.assert_array_equal(joined.layer_offsets, level.layer_offsets)
+    np.testing.assert_array_equal(joined.attributes["feed"], level.attributes["feed"])